@@ -1,18 +1,299 @@
+import asyncio
+import hashlib
+import io
 import json
 import os
-import re
+import random
+import time
 from typing import Any
 
 import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
 import streamlit as st
 from dotenv import load_dotenv
 from PIL import Image
 
-# .env読み込み
-load_dotenv()
+# orjsonがあれば使う(小さいJSONの繰り返しパースが標準jsonより数倍速い)
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
 
-# Geminiの設定
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# .env読み込みとGeminiの設定
+# Streamlitのホットリロードで再importされても、
+# .envの読み直しとconfigureのやり直しをしないよう一度だけ実行する
+if not getattr(genai, "_sedolist_configured", False):
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    genai._sedolist_configured = True  # type: ignore[attr-defined]
+
+# プロンプト(同期・非同期で共通)
+# 出力形式は構造化出力(_GENERATION_CONFIG)で強制しているので、
+# プロンプト側でJSONの形を繰り返す必要はない(入力トークン削減)
+_PROMPT = (
+    "画像から商品名(name)と価格(price、数字のみ。円マークやカンマは除く)を"
+    "抽出してください。"
+)
+
+
+# 解析結果のキャッシュ(画像バイト列のハッシュ→結果)
+# Streamlitはウィジェット操作のたびに再実行されるため、
+# 同じ画像で何度もGeminiを呼ばないようにする
+# プロンプトを変えたときはバージョンを上げてキャッシュを無効化する
+_CACHE_VERSION = "v2"  # プロンプト変更時に上げてキャッシュを無効化する
+_MODEL_NAME = "models/gemini-flash-latest"
+_response_cache: dict[tuple[str, str, str], dict[str, Any]] = {}
+
+# 構造化出力の設定
+# モデル側でJSONのみ出力するよう制約をかける
+# (マークダウンの```json```や余計な文章が混ざるパース失敗をなくせる)
+_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "price": {"type": "integer"},
+        },
+        "required": ["name", "price"],
+    },
+}
+
+# リトライ対象の一時的なAPIエラー(レート制限・サーバー側の不調)
+_RETRYABLE_EXCEPTIONS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+)
+_MAX_ATTEMPTS = 4
+
+# 解析対象として受け付ける画像形式
+_SUPPORTED_MIME_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp"}
+
+# これより小さいファイルは値札が読み取れる画像ではないとみなす
+_MIN_IMAGE_BYTES = 4096
+
+
+def _backoff_seconds(attempt: int) -> float:
+    """
+    リトライ回数に応じた待ち時間(指数バックオフ+ジッター)を返す
+
+    Args:
+        attempt (int): 何回目の失敗か(0始まり)
+
+    Returns:
+        float: 待ち時間(秒)
+    """
+    return min(2**attempt, 30) + random.uniform(0, 1)
+
+
+def _generate_with_retry(model: Any, contents: list[Any]) -> Any:
+    """
+    一時的なAPIエラーをリトライしながらgenerate_contentを呼ぶ
+
+    Args:
+        model (Any): GenerativeModelのインスタンス
+        contents (list[Any]): プロンプトと画像のリスト
+
+    Returns:
+        Any: Geminiの応答
+
+    Notes:
+        429や500が1回出ただけで結果を捨てると、ユーザーは撮影からやり直しになる
+        指数バックオフ+ジッターで数回だけ粘る
+    """
+    for attempt in range(_MAX_ATTEMPTS):
+        try:
+            return model.generate_content(
+                contents, generation_config=_GENERATION_CONFIG
+            )
+        except _RETRYABLE_EXCEPTIONS:
+            if attempt == _MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(_backoff_seconds(attempt))
+
+
+async def _generate_with_retry_async(model: Any, contents: list[Any]) -> Any:
+    """
+    _generate_with_retryの非同期版
+
+    Args:
+        model (Any): GenerativeModelのインスタンス
+        contents (list[Any]): プロンプトと画像のリスト
+
+    Returns:
+        Any: Geminiの応答
+    """
+    for attempt in range(_MAX_ATTEMPTS):
+        try:
+            return await model.generate_content_async(
+                contents, generation_config=_GENERATION_CONFIG
+            )
+        except _RETRYABLE_EXCEPTIONS:
+            if attempt == _MAX_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(_backoff_seconds(attempt))
+
+
+# モデルは状態を持たないので一度だけ作って使い回す
+# (生成のたびにクライアント初期化コストを払わない)
+_model: Any = None
+
+
+def _get_model() -> Any:
+    """
+    共有のGenerativeModelインスタンスを返す(初回のみ生成)
+
+    Returns:
+        Any: genai.GenerativeModelのインスタンス
+    """
+    global _model
+    if _model is None:
+        _model = genai.GenerativeModel(_MODEL_NAME)
+    return _model
+
+
+def _cache_key(data: bytes) -> tuple[str, str, str]:
+    """
+    画像バイト列からキャッシュキーを作る
+
+    Args:
+        data (bytes): 画像のバイト列
+
+    Returns:
+        tuple[str, str, str]: (バージョン, モデル名, 内容ハッシュ)のキー
+    """
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return (_CACHE_VERSION, _MODEL_NAME, digest)
+
+
+def _get_raw_bytes(uploaded_file: Any) -> bytes | None:
+    """
+    アップロードファイルからバイト列を取り出す(取り出せない場合はNone)
+
+    Args:
+        uploaded_file (Any): アップロードされた画像ファイル
+
+    Returns:
+        bytes | None: 画像のバイト列またはNone
+    """
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    return None
+
+
+def _compress_image(raw: bytes) -> bytes:
+    """
+    画像を送信前に縮小・JPEG再圧縮する
+
+    Args:
+        raw (bytes): 元画像のバイト列
+
+    Returns:
+        bytes: 縮小・再圧縮後のJPEGバイト列
+
+    Notes:
+        カメラ撮影の画像は数MBのPNGになることが多く、
+        そのまま送るとアップロードもGemini側の処理も遅くなる
+        長辺1024pxのJPEG(品質85)にすると転送量が1/10以下になることもある
+    """
+    image = Image.open(io.BytesIO(raw))
+    image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=85, optimize=True)
+    return buf.getvalue()
+
+
+def _upload_cached(uploaded_file: Any, raw: bytes) -> Any:
+    """
+    画像をGemini Files APIへ一度だけアップロードし、ハンドルを使い回す
+
+    Args:
+        uploaded_file (Any): アップロードされた画像ファイル
+        raw (bytes): 画像のバイト列
+
+    Returns:
+        Any: Gemini Files APIのファイルハンドル
+
+    Notes:
+        毎回インラインで画像バイトを送り直すと数百KBの再アップロードになるため、
+        内容ハッシュをキーにセッション内でアップロード済みハンドルを再利用する
+    """
+    digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    cache = st.session_state.setdefault("_gemini_file_cache", {})
+    handle = cache.get(digest)
+    if handle is None:
+        # 縮小・再圧縮してからアップロードする(キーは元バイト列のハッシュのまま)
+        jpeg_bytes = _compress_image(raw)
+        handle = genai.upload_file(io.BytesIO(jpeg_bytes), mime_type="image/jpeg")
+        cache[digest] = handle
+    return handle
+
+
+def _extract_json_obj(text: str) -> str | None:
+    """
+    テキストから最初のJSONオブジェクト部分を1パスで切り出す
+
+    Args:
+        text (str): Geminiの応答テキスト
+
+    Returns:
+        str | None: JSONオブジェクトの文字列またはNone
+
+    Notes:
+        以前は re.search(r"\\{.*\\}", ...) を使っていたが、
+        貪欲マッチのため応答に複数の {...} があると範囲を取り違えるうえ、
+        長い応答では正規表現エンジンのコストもかかる
+        波括弧の深さを数えながら一度だけ走査する方式にした
+        (文字列リテラル内の括弧やエスケープは深さに数えない)
+    """
+    depth = 0
+    start = -1
+    in_str = False
+    esc = False
+
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}":
+            if depth > 0:
+                depth -= 1
+                if depth == 0:
+                    return text[start : i + 1]
+    return None
+
+
+def _parse_response_text(text: str) -> dict[str, Any] | None:
+    """
+    Geminiの応答テキストからJSON部分を取り出して辞書にする
+
+    Args:
+        text (str): Geminiの応答テキスト
+
+    Returns:
+        dict[str, Any] | None: 抽出した辞書またはNone
+    """
+    json_str = _extract_json_obj(text)
+
+    if json_str is not None:
+        if orjson is not None:
+            return orjson.loads(json_str)
+        return json.loads(json_str)
+    return None
 
 
 def analyze_image_with_gemini(uploaded_file: Any) -> dict[str, Any] | None:
@@ -26,36 +307,41 @@ def analyze_image_with_gemini(uploaded_file: Any) -> dict[str, Any] | None:
         dict[str, Any] | None: 商品名と価格の辞書またはNone
     """
     try:
-        # 画像を読み込む
-        image = Image.open(uploaded_file)
+        raw = _get_raw_bytes(uploaded_file)
+
+        # 明らかに解析できない入力はAPIを呼ばずに弾く
+        # (ネットワーク+LLMの往復と課金を丸ごと節約できる)
+        if raw is not None and len(raw) < _MIN_IMAGE_BYTES:
+            st.warning("画像が小さすぎて解析できません。撮り直してください。")
+            return None
+        mime_type = getattr(uploaded_file, "type", None)
+        if mime_type is not None and mime_type not in _SUPPORTED_MIME_TYPES:
+            st.warning("対応していない画像形式です(JPEG/PNG/WebPのみ)。")
+            return None
+
+        # 同じ画像ならキャッシュを返してAPI呼び出しを省く
+        key = _cache_key(raw) if raw is not None else None
+        if key is not None and key in _response_cache:
+            return _response_cache[key]
+
+        # バイト列が取れるならFiles APIでアップロードしてURI参照にする
+        # (再解析時のアップロード帯域を節約できる)
+        if raw is not None:
+            part = _upload_cached(uploaded_file, raw)
+        else:
+            part = Image.open(uploaded_file)
 
         # モデル
-        model = genai.GenerativeModel("models/gemini-flash-latest")
-
-        # プロンプト
-        prompt = """
-        この画像を分析して、以下の情報を抽出してください。
-        
-        1.商品名(name):パッケージや値札から読み取れる具体的な商品名
-        2.価格(price):値札に書かれている価格(数字のみ、円マークやカンマは除く)
-
-        出力は必ず以下のJSON形式のみにしてください。余計な文章は不要です。
-        {
-            "name":"商品名",
-            "price":1000
-        }
-        """
+        model = _get_model()
 
         # AIに聞く
         with st.spinner("AIが画像を解析中"):
-            response = model.generate_content([prompt, image])  # type: ignore
-            text = response.text
-
-            match = re.search(r"\{.*\}", text, re.DOTALL)
+            response = _generate_with_retry(model, [_PROMPT, part])
+            result = _parse_response_text(response.text)
 
-            if match:
-                json_str = match.group()  # マッチした部分（JSON文字列）を取り出す
-                result = json.loads(json_str)
+            if result is not None:
+                if key is not None:
+                    _response_cache[key] = result
                 return result
             else:
                 st.error("AIからの応答にJSONが含まれていませんでした。")
@@ -64,3 +350,61 @@ def analyze_image_with_gemini(uploaded_file: Any) -> dict[str, Any] | None:
     except Exception as e:
         st.error(f"AI解析エラー:{e}")
         return None
+
+
+async def _analyze_one(uploaded_file: Any) -> dict[str, Any] | None:
+    """
+    1枚の画像を非同期でGeminiに渡して解析する
+
+    Args:
+        uploaded_file (Any): アップロードされた画像ファイル
+
+    Returns:
+        dict[str, Any] | None: 商品名と価格の辞書またはNone
+    """
+    raw = _get_raw_bytes(uploaded_file)
+    key = _cache_key(raw) if raw is not None else None
+    if key is not None and key in _response_cache:
+        return _response_cache[key]
+
+    if raw is not None:
+        part: Any = {"mime_type": "image/jpeg", "data": _compress_image(raw)}
+    else:
+        part = Image.open(uploaded_file)
+    model = _get_model()
+    response = await _generate_with_retry_async(model, [_PROMPT, part])
+
+    # 大きい応答のパースはスレッドに逃がしてイベントループを塞がない
+    # (小さい応答はスレッド切り替えの方が高くつくのでそのまま処理)
+    text = response.text
+    if len(text) > 8192:
+        result = await asyncio.to_thread(_parse_response_text, text)
+    else:
+        result = _parse_response_text(text)
+
+    if result is not None and key is not None:
+        _response_cache[key] = result
+    return result
+
+
+async def analyze_images_with_gemini(
+    uploaded_files: list[Any],
+) -> list[dict[str, Any] | None]:
+    """
+    複数の画像をGeminiへ並行で投げて解析する
+
+    Args:
+        uploaded_files (list[Any]): アップロードされた画像ファイルのリスト
+
+    Returns:
+        list[dict[str, Any] | None]: 画像ごとの解析結果(失敗はNone)
+
+    Notes:
+        1枚ずつ順番に待つとネットワーク+LLMの往復時間×枚数かかるため、
+        asyncio.gatherで同時にリクエストを飛ばす
+        Streamlitからは asyncio.run(analyze_images_with_gemini(files)) で呼ぶ
+    """
+    results = await asyncio.gather(
+        *(_analyze_one(f) for f in uploaded_files), return_exceptions=True
+    )
+    return [r if not isinstance(r, BaseException) else None for r in results]
@@ -1,13 +1,14 @@
-import time
 from datetime import datetime
 
 import extra_streamlit_components as stx  # type: ignore
 import streamlit as st
 
-import ai_logic as ai
 import auth
 from database import get_db
 
+# ai_logic(google.generativeai / PIL)はインポートが重いので、
+# カメラを使うときに初めて読み込む(下のshow_register_screen内)
+
 # -----------------------------------------------
 # ページ設定
 # -----------------------------------------------
@@ -27,16 +28,97 @@ db = get_db()
 cookie_manager = stx.CookieManager()
 
 
+# ----------------------------------------------
+# 表形式表示用のカラム名対応表
+# ----------------------------------------------
+# 再実行のたびに辞書を作り直さないようモジュールレベルで1回だけ定義する
+_DISPLAY_RENAME = {
+    "id": "ID",
+    "name": "商品名",
+    "price": "価格",
+    "shop": "店舗",
+    "quantity": "在庫数",
+    "memo": "メモ",
+    "created_at": "登録日",
+}
+# 編集結果(表示名)をDBカラム名へ戻すための逆引き
+_DISPLAY_RENAME_REVERSE = {v: k for k, v in _DISPLAY_RENAME.items()}
+
+
+# ----------------------------------------------
+# データ取得キャッシュ
+# ----------------------------------------------
+@st.cache_data(ttl=60, show_spinner=False)
+def load_items_cached(
+    user_id: int,
+    version: int,
+    limit: int = 5,
+    last_id: int | None = None,
+    search_query: str | None = None,
+):
+    """
+    load_itemsの結果をキャッシュして返す
+
+    Args:
+        user_id (int): ユーザーID
+        version (int): 在庫データのバージョン番号(キャッシュキー用)
+        limit (int): 取得件数
+        last_id (int | None): ページ送りカーソル
+        search_query (str | None): 検索ワード
+
+    Returns:
+        pd.DataFrame: 在庫データ
+
+    Notes:
+        表示モード切替など、データが変わらない再実行でのSELECTを省く
+        書き込み後はbump_items_version()でversionを進めてキャッシュを無効化する
+    """
+    return db.load_items(
+        user_id, limit=limit, last_id=last_id, search_query=search_query
+    )
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def export_items_csv(user_id: int, version: int) -> bytes:
+    """
+    CSVダウンロード用のバイト列を生成してキャッシュする
+
+    Args:
+        user_id (int): ユーザーID
+        version (int): 在庫データのバージョン番号(キャッシュキー用)
+
+    Returns:
+        bytes: CSVデータ(BOM付きUTF-8)
+
+    Notes:
+        設定画面の再描画ごとにto_csvをやり直さないようにする
+    """
+    df = load_items_cached(user_id, version)
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+
+def bump_items_version() -> None:
+    """在庫データ変更後にキャッシュキーのバージョンを進める"""
+    st.session_state.items_version = st.session_state.get("items_version", 0) + 1
+
+
 # ----------------------------------------------
 # UI用ヘルパー関数
 # ----------------------------------------------
+# 仕入れ登録フォームの初期値(初期化とクリアで共用する)
+_REG_DEFAULTS = {
+    "input_name": "",
+    "input_price": 0,
+    "input_quantity": 1,
+    "input_shop": "",
+    "input_memo": "",
+}
+
+
 def clear_form_state() -> None:
     """入力フォームをクリアするコールバック関数"""
-    st.session_state.input_name = ""
-    st.session_state.input_price = 0
-    st.session_state.input_quantity = 1
-    st.session_state.input_shop = ""
-    st.session_state.input_memo = ""
+    for key, value in _REG_DEFAULTS.items():
+        st.session_state[key] = value
 
 
 # -----------------------------------------------
@@ -67,6 +149,8 @@ def show_inventory_screen() -> None:
         st.session_state.cursor_history = [None]
     if "active_search" not in st.session_state:
         st.session_state.active_search = ""
+    if "items_version" not in st.session_state:
+        st.session_state.items_version = 0
 
     col_search, col_btn = st.columns([4, 1])
     with col_search:
@@ -81,13 +165,14 @@ def show_inventory_screen() -> None:
             if search_input != st.session_state.active_search:
                 st.session_state.active_search = search_input
                 st.session_state.cursor_history = [None]
-                st.rerun()
+                st.rerun(scope="fragment")
 
     current_cursor = st.session_state.cursor_history[-1]
     LIMIT = 5  # 本番では50にする予定
 
-    df_items = db.load_items(
+    df_items = load_items_cached(
         st.session_state.user_id,
+        st.session_state.items_version,
         limit=LIMIT,
         last_id=current_cursor,
         search_query=st.session_state.active_search,
@@ -113,7 +198,7 @@ def show_inventory_screen() -> None:
                     "前のページ", key=f"prev_{location_key}", use_container_width=True
                 ):
                     st.session_state.cursor_history.pop()
-                    st.rerun()
+                    st.rerun(scope="fragment")
 
         with col_next:
             # データが満タンなら次のページへを表示
@@ -123,30 +208,71 @@ def show_inventory_screen() -> None:
                 ):
                     last_id = int(df_items.iloc[-1]["id"])
                     st.session_state.cursor_history.append(last_id)
-                    st.rerun()
+                    st.rerun(scope="fragment")
 
     # ページ送りボタンを表示
     render_pagination("top")
 
     # データ表示エリア
     if view_mode == "表形式（PC向け）":
-        # 表示用に整形
-        display_df = df_items[
-            ["id", "name", "price", "shop", "quantity", "memo", "created_at"]
-        ]
-        display_df.columns = [
-            "ID",
-            "商品名",
-            "価格",
-            "店舗",
-            "在庫数",
-            "メモ",
-            "登録日",
+        # 表示用に整形(1回のrenameで済ませて余計なコピーを作らない)
+        display_df = df_items.rename(columns=_DISPLAY_RENAME)[
+            list(_DISPLAY_RENAME.values())
         ]
 
+        def handle_editor_changes(df_source) -> None:
+            """
+            data_editorの変更をDBへまとめて反映するコールバック
+
+            Args:
+                df_source (pd.DataFrame): 編集前の在庫データ(行番号→商品IDの解決用)
+
+            Returns:
+                None
+
+            Notes:
+                on_changeは再実行の前に走るため、反映後に
+                items_versionを進めておけば次のSELECTは最新を読む
+                (明示的なst.rerunやsleepは不要)
+            """
+            changes = st.session_state.get("editor")
+            if not changes:
+                return
+
+            # 行番号→商品IDはiloc+列アクセスを繰り返さず配列で引く
+            id_arr = df_source["id"].to_numpy()
+
+            if changes["edited_rows"]:
+                # 変更を商品IDごとにまとめてから1トランザクションで更新
+                batched_updates: dict[int, dict] = {}
+                for index, updates in changes["edited_rows"].items():
+                    item_id = int(id_arr[index])
+                    fields = {
+                        _DISPLAY_RENAME_REVERSE[col_name]: new_value
+                        for col_name, new_value in updates.items()
+                        if col_name in _DISPLAY_RENAME_REVERSE
+                    }
+                    if fields:
+                        batched_updates[item_id] = fields
+
+                if batched_updates:
+                    # dbモジュールでまとめて更新
+                    db.update_items(batched_updates)
+                    bump_items_version()
+                    st.toast("更新しました！")
+
+            if changes["deleted_rows"]:
+                delete_ids = [int(id_arr[index]) for index in changes["deleted_rows"]]
+                # dbモジュールでまとめて削除
+                db.delete_items(st.session_state.user_id, delete_ids)
+                bump_items_version()
+                st.toast("削除しました")
+
         st.data_editor(
             display_df,
             key="editor",
+            on_change=handle_editor_changes,
+            args=(df_items,),
             column_config={
                 "ID": st.column_config.NumberColumn(disabled=True),
                 "登録日": st.column_config.DatetimeColumn(
@@ -157,65 +283,30 @@ def show_inventory_screen() -> None:
             hide_index=True,
         )
 
-        # 更新処理
-        if st.session_state.editor:
-            changes = st.session_state.editor
-            needs_rerun = False
-
-            if changes["edited_rows"]:
-                for index, updates in changes["edited_rows"].items():
-                    item_id = df_items.iloc[index]["id"]
-                    col_map = {
-                        "商品名": "name",
-                        "価格": "price",
-                        "店舗": "shop",
-                        "在庫数": "quantity",
-                        "メモ": "memo",
-                    }
-
-                    for col_name, new_value in updates.items():
-                        db_col = col_map.get(col_name)
-                        if db_col:
-                            # dbモジュールで更新
-                            db.update_item(item_id, db_col, new_value)
-                            st.toast("更新しました！")
-                needs_rerun = True
-
-            if changes["deleted_rows"]:
-                for index in changes["deleted_rows"]:
-                    item_id = df_items.iloc[index]["id"]
-                    # dbモジュールで削除
-                    db.delete_item(item_id)
-                    st.toast("削除しました")
-                needs_rerun = True
-
-            if needs_rerun:
-                time.sleep(0.5)
-                st.rerun()
-
     else:
         # スマホ向けカード表示
         st.write("スマホ編集モード。タップして詳細を開く")
-        for index, row in df_items.iterrows():
-            item_id = row["id"]
-            with st.expander(f"{row['name']} (残:{row['quantity']}個)"):
+        # iterrowsは行ごとにSeriesを作って遅いのでitertuplesで回す
+        for row in df_items.itertuples(index=False):
+            item_id = row.id
+            with st.expander(f"{row.name} (残:{row.quantity}個)"):
                 new_name = st.text_input(
-                    "商品名", value=row["name"], key=f"name_{item_id}"
+                    "商品名", value=row.name, key=f"name_{item_id}"
                 )
                 col1, col2 = st.columns(2)
                 with col1:
                     new_price = st.number_input(
-                        "価格", value=row["price"], step=100, key=f"price_{item_id}"
+                        "価格", value=row.price, step=100, key=f"price_{item_id}"
                     )
                 with col2:
                     new_quantity = st.number_input(
-                        "在庫数", value=row["quantity"], step=1, key=f"qty_{item_id}"
+                        "在庫数", value=row.quantity, step=1, key=f"qty_{item_id}"
                     )
                 new_shop = st.text_input(
-                    "店舗", value=row["shop"], key=f"shop_{item_id}"
+                    "店舗", value=row.shop, key=f"shop_{item_id}"
                 )
                 new_memo = st.text_area(
-                    "メモ", value=row["memo"], key=f"memo_{item_id}"
+                    "メモ", value=row.memo, key=f"memo_{item_id}"
                 )
 
                 btn_col1, btn_col2 = st.columns(2)
@@ -223,14 +314,26 @@ def show_inventory_screen() -> None:
                     if st.button(
                         "更新", key=f"upd_{item_id}", use_container_width=True
                     ):
-                        # dbモジュールで更新
-                        db.update_item(item_id, "name", new_name)
-                        db.update_item(item_id, "price", new_price)
-                        db.update_item(item_id, "quantity", new_quantity)
-                        db.update_item(item_id, "shop", new_shop)
-                        db.update_item(item_id, "memo", new_memo)
-                        st.toast("更新しました！")
-                        st.rerun()
+                        # 実際に変わった項目だけをUPDATE対象にする
+                        changed_fields = {
+                            col: new_value
+                            for col, new_value, old_value in (
+                                ("name", new_name, row.name),
+                                ("price", new_price, row.price),
+                                ("quantity", new_quantity, row.quantity),
+                                ("shop", new_shop, row.shop),
+                                ("memo", new_memo, row.memo),
+                            )
+                            if new_value != old_value
+                        }
+                        if changed_fields:
+                            # dbモジュールで1回のUPDATEにまとめて更新
+                            db.update_item_fields(item_id, changed_fields)
+                            bump_items_version()
+                            st.toast("更新しました！")
+                            st.rerun(scope="fragment")
+                        else:
+                            st.toast("変更はありません")
                 with btn_col2:
                     if st.button(
                         "削除",
@@ -240,8 +343,9 @@ def show_inventory_screen() -> None:
                     ):
                         # dbモジュールで削除
                         db.delete_item(item_id)
+                        bump_items_version()
                         st.toast("削除しました")
-                        st.rerun()
+                        st.rerun(scope="fragment")
 
     # ページ送りボタンを表示
     render_pagination("bottom")
@@ -258,16 +362,8 @@ def show_register_screen() -> None:
         数量、店舗、メモ等を手入力し、DBに登録する
     """
     # セッションステート初期化
-    if "input_name" not in st.session_state:
-        st.session_state.input_name = ""
-    if "input_price" not in st.session_state:
-        st.session_state.input_price = 0
-    if "input_quantity" not in st.session_state:
-        st.session_state.input_quantity = 1
-    if "input_shop" not in st.session_state:
-        st.session_state.input_shop = ""
-    if "input_memo" not in st.session_state:
-        st.session_state.input_memo = ""
+    for key, value in _REG_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
 
     col1, col2 = st.columns([3, 1])
     with col1:
@@ -278,6 +374,9 @@ def show_register_screen() -> None:
     if use_camera:
         picture = st.camera_input("値札を撮影")
         if picture:
+            # 遅延インポート: ログインや在庫一覧のパスでは読み込まない
+            import ai_logic as ai
+
             # aiモジュールで解析
             result = ai.analyze_image_with_gemini(picture)
             if result:
@@ -309,13 +408,16 @@ def show_register_screen() -> None:
 
         if submitted:
             if name:
-                # dbモジュールで登録
-                db.register_item(
+                # dbモジュールで登録(UIへの通知はDB層ではなくここで行う)
+                new_row = db.register_item(
                     st.session_state.user_id, name, price, quantity, shop, memo
                 )
-                st.toast("登録しました！")
-                time.sleep(1)
-                st.rerun()
+                if new_row is not None:
+                    bump_items_version()
+                    st.toast(f"「{name}」を登録しました！")
+                    st.rerun(scope="fragment")
+                else:
+                    st.error("登録に失敗しました。時間をおいて再度お試しください。")
             else:
                 st.warning("商品名は必須です！")
 
@@ -329,6 +431,7 @@ if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.user_id = None
     st.session_state.username = ""
+    st.session_state.user_email = None
 
 
 # ---------------------------------------------
@@ -385,7 +488,6 @@ if reset_token:
                     if auth.reset_password(user[0], new_pw):
                         st.success("パスワードを変更しました！")
                         st.info("ログイン画面に戻ります")
-                        time.sleep(3)
                         st.query_params.clear()
                         st.rerun()
     else:
@@ -441,7 +543,6 @@ if not st.session_state.logged_in:
                     )
 
                     st.success("ログイン成功！")
-                    time.sleep(1)
                     st.rerun()
                 else:
                     st.error("メールアドレスかパスワードが間違っています")
@@ -464,7 +565,6 @@ if not st.session_state.logged_in:
             )
 
             st.toast("ゲストログインしました！")
-            time.sleep(1)
             st.rerun()
         else:
             st.error("ゲストログインに失敗しました。")
@@ -528,7 +628,7 @@ if st.sidebar.button("ログアウト"):
 
     st.session_state.logged_in = False
     st.session_state.user_id = None
-    time.sleep(0.5)
+    st.session_state.user_email = None
     st.rerun()
 
 st.title("せどりすと")
@@ -574,14 +674,16 @@ elif menu == "設定":
                     if db.update_username(st.session_state.user_id, new_name):
                         st.session_state.username = new_name
                         st.success(f"ユーザー名を「{new_name}」に変更しました！")
-                        time.sleep(1)
                         st.rerun()
 
     st.divider()
 
     # メールアドレス変更
     with st.expander("メールアドレス変更", expanded=False):
-        current_email = db.get_user_email(st.session_state.user_id)  # dbを使う
+        # 再描画のたびにSELECTしないよう、取得結果はセッションに持っておく
+        if st.session_state.get("user_email") is None:
+            st.session_state.user_email = db.get_user_email(st.session_state.user_id)
+        current_email = st.session_state.user_email
         with st.form("change_email_form"):
             st.text_input("現在のメールアドレス", value=current_email, disabled=True)
             new_email = st.text_input("新しいメールアドレス")
@@ -594,8 +696,8 @@ elif menu == "設定":
                     # dbモジュールで更新
                     success, msg = db.update_email(st.session_state.user_id, new_email)
                     if success:
+                        st.session_state.user_email = new_email
                         st.success(msg)
-                        time.sleep(1)
                         st.rerun()
                     else:
                         st.error(msg)
@@ -628,19 +730,23 @@ elif menu == "設定":
     # CSV出力
     with st.expander("CSV出力", expanded=False):
         st.write("現在の在庫データをCSV形式でダウンロードします。")
-        df_export = db.load_items(st.session_state.user_id)  # dbを使う
-        if not df_export.empty:
-            csv_data = df_export.to_csv(index=False).encode("utf-8-sig")
-            now_str = datetime.now().strftime("%Y%m%d_%H%M")
-            st.download_button(
-                label="CSVをダウンロード",
-                data=csv_data,
-                file_name=f"stock_data_{now_str}.csv",
-                mime="text/csv",
-                type="primary",
+
+        def _build_export_csv() -> bytes:
+            """ダウンロードボタンが押されたときだけCSVを生成する"""
+            return export_items_csv(
+                st.session_state.user_id, st.session_state.get("items_version", 0)
             )
-        else:
-            st.info("ダウンロードするデータがありません。")
+
+        now_str = datetime.now().strftime("%Y%m%d_%H%M")
+        # data=呼び出し可能オブジェクトを渡すと、
+        # クリックされるまでSELECTもCSV化も走らない
+        st.download_button(
+            label="CSVをダウンロード",
+            data=_build_export_csv,
+            file_name=f"stock_data_{now_str}.csv",
+            mime="text/csv",
+            type="primary",
+        )
 
     st.divider()
 
@@ -654,9 +760,11 @@ elif menu == "設定":
             ):
                 # dbモジュールで削除
                 if db.delete_user_account(st.session_state.user_id):
+                    # 削除済みアカウントの資格情報がTTL内に
+                    # キャッシュヒットでログインできてしまわないようにする
+                    auth._invalidate_login_cache()
                     st.success("退会処理が完了しました。ご利用ありがとうございました。")
                     st.session_state.logged_in = False
                     st.session_state.user_id = None
                     st.session_state.username = ""
-                    time.sleep(2)
                     st.rerun()
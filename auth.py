@@ -1,19 +1,131 @@
+import base64
+import functools
 import hashlib
+import hmac
 import os
 import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import bcrypt
-import streamlit as st
+from sqlalchemy import bindparam, func, select, update
 from sqlalchemy.orm import Session
 
 from database import SessionLocal, UserModel, get_db
 from mail_service import send_reset_email
 
+# -----------------------------------------------
+# ホットパス用のSELECT文
+# -----------------------------------------------
+# 呼び出しのたびにクエリを組み立て直さず、
+# モジュールレベルで1回だけ構築してSQLAlchemyのコンパイル済み
+# キャッシュに確実に乗せる(必要なカラムだけ取得する)
+_LOGIN_USER_STMT = (
+    select(UserModel.id, UserModel.username, UserModel.password_hash)
+    .where(UserModel.email == bindparam("email"))
+    .limit(1)
+)
+
+# 期限はDBサーバー側のnow()で判定する(クロックのずれ・TZ変換を避ける)
+_RESET_TOKEN_STMT = (
+    select(UserModel.id, UserModel.email)
+    .where(
+        UserModel.reset_token == bindparam("token"),
+        UserModel.reset_token_expires_at > func.now(),
+    )
+    .limit(1)
+)
+
+# argon2はオプション依存(argon2-cffi)。入っていなければbcryptのみ
+try:
+    from argon2 import PasswordHasher
+    from argon2 import exceptions as argon2_exceptions
+except ImportError:
+    PasswordHasher = None  # type: ignore[assignment, misc]
+    argon2_exceptions = None  # type: ignore[assignment]
+
+# bcryptのコスト係数
+# 本番は12のまま、開発環境では環境変数で10などに下げられるようにする
+BCRYPT_COST = int(os.getenv("BCRYPT_COST", "12"))
+
+# 新規ハッシュに使うバックエンド(PWHASH=argon2でargon2idに切り替え)
+# 照合は保存形式のプレフィックスで判別するので混在していても動く
+_PWHASH_BACKEND = os.getenv("PWHASH", "bcrypt")
+_argon2_hasher = (
+    PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+    if _PWHASH_BACKEND == "argon2" and PasswordHasher is not None
+    else None
+)
+
+# サーバー側秘密(ペッパー)。設定されている場合のみ、
+# ハッシュ前にHMAC-SHA256を一段かませてDB流出単体では
+# オフライン総当たりできないようにする
+# 注意: 一度有効にすると既存ハッシュと照合できなくなるため、
+# 新規デプロイ時から使う想定
+_PEPPER = os.getenv("PASSWORD_PEPPER", "").encode()
+
+# ハッシュ計算はC拡張内でGILを解放するため、
+# 専用スレッドで実行してStreamlitのスレッドをブロックしないようにする
+_pwhash_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def _prehash(password: str) -> str:
+    """ペッパーが設定されていればHMACで前処理した文字列を返す"""
+    if not _PEPPER:
+        return password
+    # hexdigestは64文字でbcryptの72バイト制限にも収まる
+    return hmac.new(_PEPPER, password.encode("utf-8"), "sha256").hexdigest()
+
+
+def _checkpw(password: str, password_hash: str) -> bool:
+    """保存形式に応じた方式でパスワード照合をワーカースレッドで実行する"""
+    password = _prehash(password)
+    if password_hash.startswith("$argon2"):
+        if PasswordHasher is None:
+            return False
+        hasher = _argon2_hasher or PasswordHasher()
+        try:
+            return _pwhash_executor.submit(
+                hasher.verify, password_hash, password
+            ).result()
+        except argon2_exceptions.VerificationError:
+            return False
+
+    future = _pwhash_executor.submit(
+        bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8")
+    )
+    return future.result()
+
+
+def _hashpw(password: str) -> str:
+    """設定されたバックエンドでパスワードをハッシュ化する(ワーカースレッド実行)"""
+    password = _prehash(password)
+    if _argon2_hasher is not None:
+        return _pwhash_executor.submit(_argon2_hasher.hash, password).result()
+
+    salt = bcrypt.gensalt(rounds=BCRYPT_COST)
+    future = _pwhash_executor.submit(bcrypt.hashpw, password.encode("utf-8"), salt)
+    return future.result().decode("utf-8")
+
+
+# 存在しないメールアドレスでもbcrypt照合を1回走らせるためのダミーハッシュ
+# (応答時間の差からアカウントの有無を推測されないようにする)
+_dummy_hash: str | None = None
+
+
+def _get_dummy_hash() -> str:
+    """ダミーハッシュを初回利用時に生成して使い回す"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = _hashpw(secrets.token_urlsafe(16))
+    return _dummy_hash
+
 
 def cleanup_expired_tokens(db: Session) -> None:
     """
-    有効期限切れのリセットトークンを削除する
+    有効期限切れのリセットトークンを削除する(コミットは呼び出し側で行う)
 
     Args:
         db (Session): SQLAlchemyセッション
@@ -24,24 +136,23 @@ def cleanup_expired_tokens(db: Session) -> None:
     Notes:
         synchronize_session=Falseで素早く削除する
     """
-    try:
-        now = datetime.now()
-        # 期限切れかつトークンが残っているユーザーを検索して更新
-        db.query(UserModel).filter(UserModel.reset_token_expires_at < now).update(
-            {
-                UserModel.reset_token: None,
-                UserModel.reset_token_expires_at: None,
-            },
-            synchronize_session=False,
-        )
-        db.commit()
-    except Exception:
-        pass  # クリーンアップ失敗はメイン処理に影響させない
+    # 期限切れかつトークンが残っているユーザーを検索して更新
+    # (reset_token IS NOT NULL条件で部分インデックスに乗せる)
+    db.query(UserModel).filter(
+        UserModel.reset_token.isnot(None),
+        UserModel.reset_token_expires_at < func.now(),
+    ).update(
+        {
+            UserModel.reset_token: None,
+            UserModel.reset_token_expires_at: None,
+        },
+        synchronize_session=False,
+    )
 
 
 def cleanup_expired_guests(db: Session) -> None:
     """
-    作成から24時間経過したゲストユーザーを削除する
+    作成から24時間経過したゲストユーザーを削除する(コミットは呼び出し側で行う)
 
     Args:
         db (Session): SQLAlchemyセッション
@@ -52,30 +163,116 @@ def cleanup_expired_guests(db: Session) -> None:
     Notes:
         synchronize_session=Falseで素早く削除する
     """
-    try:
-        # 24時間前の時間を計算
-        cutoff_time = datetime.now() - timedelta(hours=24)
-        # 条件
-        # guestユーザーかつ作成日時が24時間前以前
-        deleted_count = (
-            db.query(UserModel)
-            .filter(
-                UserModel.email.like("guest_%@example.com"),
-                UserModel.created_at < cutoff_time,
-            )
-            .delete(synchronize_session=False)
+    # 24時間前の時間を計算
+    cutoff_time = datetime.now() - timedelta(hours=24)
+    # 条件
+    # guestユーザーかつ作成日時が24時間前以前
+    deleted_count = (
+        db.query(UserModel)
+        .filter(
+            UserModel.email.like("guest_%@example.com"),
+            UserModel.created_at < cutoff_time,
         )
+        .delete(synchronize_session=False)
+    )
 
-        db.commit()
+    if deleted_count > 0:
+        print(f"期限切れのゲストユーザーを削除しました: {deleted_count}件")
 
-        if deleted_count > 0:
-            print(f"期限切れのゲストユーザーを削除しました: {deleted_count}件")
 
+def cleanup_stale(db: Session) -> None:
+    """
+    期限切れトークンとゲストユーザーをまとめて掃除する
+
+    Args:
+        db (Session): SQLAlchemyセッション
+
+    Returns:
+        None
+
+    Notes:
+        2つの掃除を1トランザクションにまとめてコミットを1回にする
+        クリーンアップ失敗はメイン処理に影響させない
+    """
+    try:
+        cleanup_expired_tokens(db)
+        cleanup_expired_guests(db)
+        db.commit()
     except Exception as e:
-        print(f"ゲストユーザーのクリーンアップに失敗しました: {e}")
+        print(f"クリーンアップに失敗しました: {e}")
         db.rollback()
 
 
+# -----------------------------------------------
+# 認証済みログインの短期キャッシュ
+# -----------------------------------------------
+# 同じ資格情報での再ログインを毎回bcrypt(~200ms)に通さないための
+# 短いTTLのキャッシュ。キーはプロセス内秘密鍵でHMAC化するので
+# メモリ上に平文パスワードもその単純ハッシュも残らない
+_LOGIN_CACHE_TTL = 60
+_LOGIN_CACHE_MAX = 512
+_login_cache: dict[bytes, tuple[int, str, float]] = {}
+_login_cache_lock = threading.Lock()
+_login_cache_secret = secrets.token_bytes(32)
+
+
+def _login_cache_key(email: str, password: str) -> bytes:
+    """メールアドレスとパスワードからキャッシュキーを作る"""
+    return hmac.new(
+        _login_cache_secret, f"{email}|{password}".encode(), "sha256"
+    ).digest()
+
+
+def _invalidate_login_cache() -> None:
+    """パスワード変更時に秘密鍵を作り直してキャッシュを一括無効化する"""
+    global _login_cache_secret
+    with _login_cache_lock:
+        _login_cache_secret = secrets.token_bytes(32)
+        _login_cache.clear()
+
+
+# クリーンアップの実行間隔(秒)
+_CLEANUP_INTERVAL_SECONDS = 600
+
+
+def _bg_cleanup() -> None:
+    """バックグラウンドスレッドで期限切れデータを掃除する"""
+    db = SessionLocal()
+    try:
+        cleanup_stale(db)
+    finally:
+        db.close()
+
+
+def _run_periodic_cleanup() -> None:
+    """掃除を実行して次回のタイマーを仕掛け直す"""
+    try:
+        _bg_cleanup()
+    finally:
+        _schedule_periodic_cleanup()
+
+
+def _schedule_periodic_cleanup() -> None:
+    """
+    10分ごとのクリーンアップタイマーを開始する
+
+    Returns:
+        None
+
+    Notes:
+        ログインをトリガーにすると誰かが毎回掃除の書き込みを待つことになるため、
+        デーモンタイマーで定期実行する
+        専用セッションを使うスレッドなのでStreamlitのコンテキストは不要
+    """
+    timer = threading.Timer(_CLEANUP_INTERVAL_SECONDS, _run_periodic_cleanup)
+    timer.daemon = True
+    timer.start()
+
+
+# モジュール読み込み時に一度だけ開始(プロセスにつき1本)
+_schedule_periodic_cleanup()
+
+
 def check_login(email: str, password: str) -> tuple[int, str] | tuple[None, None]:
     """
     メールアドレスとパスワードでログイン認証を行う
@@ -89,25 +286,54 @@ def check_login(email: str, password: str) -> tuple[int, str] | tuple[None, None
         tuple[int, str] | tuple[None, None]: (user_id, username)または(None, None)
 
     Notes:
-        サーバーの起動を抑えるためクーロンで定期的に起動するのではなく、
-        だれかのログインをトリガーに、
-        期限切れのトークンと24時間経過したゲストユーザーを削除する
+        期限切れトークンとゲストユーザーの掃除は
+        定期実行のバックグラウンドタイマーに任せている
+        (_schedule_periodic_cleanup参照)
     """
+    # 直近に同じ資格情報で成功していればbcryptを省略する
+    # (database._session_cacheと同様、辞書の操作はロックで保護する)
+    cache_key = _login_cache_key(email, password)
+    with _login_cache_lock:
+        cached = _login_cache.get(cache_key)
+        if cached is not None:
+            user_id, username, expires = cached
+            if time.monotonic() < expires:
+                return user_id, username
+            _login_cache.pop(cache_key, None)
+
     db = SessionLocal()
     try:
-        user = db.query(UserModel).filter(UserModel.email == email).first()
+        user = db.execute(_LOGIN_USER_STMT, {"email": email}).first()
         if user:
             # パスワード照合
-            if bcrypt.checkpw(
-                password.encode("utf-8"), user.password_hash.encode("utf-8")
-            ):
-                # 期限切れのトークンと24時間経過したゲストユーザーを削除
-                cleanup_expired_tokens(db)
-                cleanup_expired_guests(db)
+            if _checkpw(password, user.password_hash):
+                # argon2運用時は旧bcryptハッシュをログイン成功時に移行する
+                if _argon2_hasher is not None and not user.password_hash.startswith(
+                    "$argon2"
+                ):
+                    db.query(UserModel).filter(UserModel.id == user.id).update(
+                        {UserModel.password_hash: _hashpw(password)},
+                        synchronize_session=False,
+                    )
+                    db.commit()
+
+                # 認証成功をTTL付きでキャッシュ(あふれたら古いものから捨てる)
+                with _login_cache_lock:
+                    if len(_login_cache) >= _LOGIN_CACHE_MAX:
+                        _login_cache.pop(next(iter(_login_cache)), None)
+                    _login_cache[cache_key] = (
+                        int(user.id),
+                        str(user.username),
+                        time.monotonic() + _LOGIN_CACHE_TTL,
+                    )
                 return int(user.id), str(user.username)
+        else:
+            # メールアドレスが存在しない場合もダミー照合を行い、
+            # 応答時間でアカウントの有無が分からないようにする
+            _checkpw(password, _get_dummy_hash())
         return None, None
     except Exception as e:
-        st.error(f"ログインエラー:{e}")
+        print(f"ログインエラー:{e}")
         return None, None
     finally:
         db.close()
@@ -130,12 +356,12 @@ def register_user(username: str, email: str, password: str) -> tuple[bool, str]:
     db = SessionLocal()
 
     try:
-        if db.query(UserModel).filter(UserModel.email == email).first():
+        # 存在確認だけなのでエンティティを構築せずidだけ引く
+        if db.execute(select(UserModel.id).where(UserModel.email == email)).first():
             return False, "そのメールアドレスは既に登録されています。"
 
         # パスワードのハッシュ化
-        salt = bcrypt.gensalt()
-        password_hash = bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+        password_hash = _hashpw(password)
 
         # ユーザー作成
         new_user = UserModel(
@@ -199,21 +425,26 @@ def change_password(
     db = SessionLocal()
 
     try:
-        user = db.query(UserModel).filter(UserModel.id == user_id).first()
-        if not user:
+        # 照合に必要なハッシュだけ取得する(エンティティは構築しない)
+        row = db.execute(
+            select(UserModel.password_hash).where(UserModel.id == user_id)
+        ).first()
+        if not row:
             return False, "ユーザーが見つかりません"
 
         # 現在のパスワードチェック
-        if not bcrypt.checkpw(
-            current_password.encode("utf-8"), user.password_hash.encode("utf-8")
-        ):
+        if not _checkpw(current_password, row.password_hash):
             return False, "現在のパスワードが間違っています"
 
-        # 新しいパスワードをハッシュ化して更新
-        salt = bcrypt.gensalt()
-        new_hash = bcrypt.hashpw(new_password.encode("utf-8"), salt).decode("utf-8")
-        user.password_hash = str(new_hash)  # type: ignore
+        # 新しいパスワードをハッシュ化して1回のUPDATEで更新
+        db.execute(
+            update(UserModel)
+            .where(UserModel.id == user_id)
+            .values(password_hash=_hashpw(new_password))
+        )
         db.commit()
+        # 旧パスワードでのキャッシュヒットを防ぐ
+        _invalidate_login_cache()
         return True, "パスワードを変更しました！"
     except Exception as e:
         return False, f"エラーが発生しました:{e}"
@@ -221,6 +452,27 @@ def change_password(
         db.close()
 
 
+def _hash_reset_token(url_token: str) -> str | None:
+    """
+    URLに載せたトークンをDB保存形式(SHA-256ハッシュ)に変換する
+
+    Args:
+        url_token (str): URLクエリから受け取ったトークン
+
+    Returns:
+        str | None: ハッシュ値(16進文字列)、復号できない入力はNone
+
+    Notes:
+        DBには生トークンではなくハッシュのみを保存するので、
+        DBが流出してもリセットリンクを再現できない
+    """
+    try:
+        raw = base64.urlsafe_b64decode(url_token + "=" * (-len(url_token) % 4))
+    except ValueError:
+        return None
+    return hashlib.sha256(raw).hexdigest()
+
+
 def issue_reset_token(email: str) -> bool:
     """
     パスワードリセット用のトークンを発行し、メールを送信する。
@@ -234,19 +486,33 @@ def issue_reset_token(email: str) -> bool:
     db = SessionLocal()
 
     try:
-        # ユーザー存在確認
-        user = db.query(UserModel).filter(UserModel.email == email).first()
-        if not user:
-            return False
-
-        # トークン生成
-        token = secrets.token_urlsafe(32)
-        expires_at = datetime.now() + timedelta(hours=1)
-
-        user.reset_token = str(token)  # type: ignore
-        user.reset_token_expires_at = expires_at  # type: ignore
+        # トークン生成(URLには生トークン、DBにはハッシュだけを保存する)
+        raw = secrets.token_bytes(32)
+        token = base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+        token_hash = hashlib.sha256(raw).hexdigest()
+        # 期限の判定(_RESET_TOKEN_STMT)はDBのnow()で行うので、
+        # 書き込みもDBのnow()基準にしてアプリとDBの時計ずれの影響を受けないようにする
+        # (timedeltaはpsycopg2がinterval型として渡す)
+        expires_at = func.now() + timedelta(hours=1)
+
+        # SELECT→UPDATEの2往復ではなく、1回のUPDATEで存在確認も兼ねる
+        updated = (
+            db.query(UserModel)
+            .filter(UserModel.email == email)
+            .update(
+                {
+                    UserModel.reset_token: token_hash,
+                    UserModel.reset_token_expires_at: expires_at,
+                },
+                synchronize_session=False,
+            )
+        )
         db.commit()
 
+        # 更新行数0 = ユーザーが存在しない
+        if not updated:
+            return False
+
         # URL生成
         base_url = os.getenv("APP_URL", "http://localhost:8501")
         reset_url = f"{base_url}/?token={token}"
@@ -255,11 +521,11 @@ def issue_reset_token(email: str) -> bool:
         if send_reset_email(email, reset_url):
             return True
         else:
-            st.error("メール送信に失敗しました。再度お試しください。")
+            print("メール送信エラー: リセットメールを送信できませんでした")
             return False
 
     except Exception as e:
-        st.error(f"トークン発行エラー:{e}")
+        print(f"トークン発行エラー:{e}")
         return False
     finally:
         db.close()
@@ -275,16 +541,14 @@ def verify_reset_token(token: str) -> tuple[int, str] | None:
     Returns:
         tuple[int, str] | None: ユーザーIDとメールアドレスのタプルまたはNone
     """
+    # DBに保存されているのはハッシュなので、照合前に変換する
+    token_hash = _hash_reset_token(token)
+    if token_hash is None:
+        return None
+
     db = SessionLocal()
     try:
-        user = (
-            db.query(UserModel)
-            .filter(
-                UserModel.reset_token == token,
-                UserModel.reset_token_expires_at > datetime.now(),
-            )
-            .first()
-        )
+        user = db.execute(_RESET_TOKEN_STMT, {"token": token_hash}).first()
 
         if user:
             return (int(user.id), str(user.email))
@@ -306,19 +570,25 @@ def reset_password(user_id: int, new_password: str) -> bool:
     """
     db = SessionLocal()
     try:
-        user = db.query(UserModel).filter(UserModel.id == user_id).first()
-        if user:
-            salt = bcrypt.gensalt()
-            user.password_hash = bcrypt.hashpw(
-                new_password.encode("utf-8"), salt
-            ).decode("utf-8")  # type: ignore
-            user.reset_token = None  # type: ignore
-            user.reset_token_expires_at = None  # type: ignore
-            db.commit()
+        # パスワード更新とトークン破棄を1回のUPDATEにまとめる
+        result = db.execute(
+            update(UserModel)
+            .where(UserModel.id == user_id)
+            .values(
+                password_hash=_hashpw(new_password),
+                reset_token=None,
+                reset_token_expires_at=None,
+            )
+        )
+        db.commit()
+
+        if result.rowcount:
+            # 旧パスワードでのキャッシュヒットを防ぐ
+            _invalidate_login_cache()
             return True
         return False
     except Exception as e:
-        st.error(f"パスワードリセットエラー:{e}")
+        print(f"パスワードリセットエラー:{e}")
         return False
     finally:
         db.close()
@@ -327,6 +597,24 @@ def reset_password(user_id: int, new_password: str) -> bool:
 # -----------------------------------------------
 # セッション管理 (永続ログイン)
 # -----------------------------------------------
+@functools.lru_cache(maxsize=128)
+def _hash_token(raw_token: str) -> str:
+    """
+    セッショントークンをハッシュ化する
+
+    Args:
+        raw_token (str): クッキー用の生トークン
+
+    Returns:
+        str: ハッシュ値(16進文字列)
+
+    Notes:
+        短い入力にはSHA-256より速いBLAKE2bを使う
+        再実行のたびに同じトークンを再ハッシュしないようlru_cacheで使い回す
+    """
+    return hashlib.blake2b(raw_token.encode(), digest_size=32).hexdigest()
+
+
 def create_session_token(user_id: int) -> str:
     """
     セッションを作成し、クッキー用のトークンを返す。
@@ -347,7 +635,7 @@ def create_session_token(user_id: int) -> str:
     raw_token = secrets.token_urlsafe(32)
 
     # 2. ハッシュ化
-    token_hash = hashlib.sha256(raw_token.encode()).hexdigest()
+    token_hash = _hash_token(raw_token)
 
     # 3. DB保存
     expires_at = datetime.now() + timedelta(days=30)
@@ -372,7 +660,7 @@ def validate_session_token(raw_token: str) -> tuple[int, str] | tuple[None, None
     db = get_db()
 
     # 1. ハッシュ化
-    token_hash = hashlib.sha256(raw_token.encode()).hexdigest()
+    token_hash = _hash_token(raw_token)
 
     # 2. 検証
     user_info = db.get_user_by_session(token_hash)
@@ -393,5 +681,5 @@ def revoke_session_token(raw_token: str) -> None:
         return
 
     db = get_db()
-    token_hash = hashlib.sha256(raw_token.encode()).hexdigest()
+    token_hash = _hash_token(raw_token)
     db.delete_session(token_hash)
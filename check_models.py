@@ -1,12 +1,51 @@
+import json
 import os
+import tempfile
+import time
+from pathlib import Path
 
 import google.generativeai as genai
 from dotenv import load_dotenv
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# モデル一覧のキャッシュ先と有効期間(秒)
+_CACHE_PATH = Path(tempfile.gettempdir()) / "gemini_models.json"
+_CACHE_TTL = 3600
 
-print("利用可能モデル一覧:")
-for m in genai.list_models():
-    if "generateContent" in m.supported_generation_methods:
-        print(f"- {m.name}")
+
+def list_generate_content_models():
+    """generateContent対応モデルの名前一覧を返す
+
+    Returns:
+        list[str]: モデル名のリスト
+
+    Notes:
+        list_modelsはネットワーク往復なので、結果を1時間
+        一時ファイルにキャッシュして開発中の再実行を速くする
+    """
+    if _CACHE_PATH.exists() and time.time() - _CACHE_PATH.stat().st_mtime < _CACHE_TTL:
+        try:
+            return json.loads(_CACHE_PATH.read_text())
+        except (ValueError, OSError):
+            pass  # 壊れたキャッシュは無視して取得し直す
+
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+    names = [
+        m.name
+        for m in genai.list_models()
+        if "generateContent" in m.supported_generation_methods
+    ]
+
+    try:
+        _CACHE_PATH.write_text(json.dumps(names))
+    except OSError:
+        pass  # キャッシュできなくても一覧表示はできる
+
+    return names
+
+
+if __name__ == "__main__":
+    print("利用可能モデル一覧:")
+    for name in list_generate_content_models():
+        print(f"- {name}")
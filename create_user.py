@@ -1,10 +1,4 @@
-import os
-
-import bcrypt
-import psycopg2
-from dotenv import load_dotenv
-
-load_dotenv()
+from auth import register_user
 
 
 def create_user(username, email, password):
@@ -20,39 +14,14 @@ def create_user(username, email, password):
 
     Notes:
         開発中テスト用にユーザーを作成する
+        auth.register_userを使うので、ハッシュ方式・コスト設定・
+        コネクションプールが本体と共通になる
     """
-    # パスワードをハッシュ化する
-    salt = bcrypt.gensalt()
-    password_hash = bcrypt.hashpw(password.encode("utf-8"), salt)
-
-    # DBに接続
-    conn = psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-        database=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASS"),
-    )
-    cursor = conn.cursor()
-
-    try:
-        # DBに登録
-        cursor.execute(
-            """
-        INSERT INTO users (username,email,password_hash)
-        VALUES (%s,%s,%s)
-        """,
-            (username, email, password_hash.decode("utf-8")),
-        )
-
-        conn.commit()
+    success, msg = register_user(username, email, password)
+    if success:
         print(f"ユーザー作成成功:{username}({email})")
-
-    except Exception as e:
-        print(f"エラー:{e}")
-        conn.rollback()
-    finally:
-        conn.close()
+    else:
+        print(f"エラー:{msg}")
 
 
 if __name__ == "__main__":
@@ -1,4 +1,10 @@
+import csv
+import io
 import os
+import random
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Any
 
@@ -9,10 +15,12 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     create_engine,
+    insert,
     inspect,
     text,
 )
@@ -28,7 +36,34 @@ load_dotenv()
 # データベースURLの構築
 DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
 # エンジンの作成
-engine = create_engine(DATABASE_URL, pool_size=10, max_overflow=20)
+# pool_pre_ping: プール内の死んだ接続(サーバー側タイムアウト等)を
+# 使う前に検出して作り直す
+# keepalives: アイドル接続がNAT/LBに黙って切られないようTCPレベルで維持する
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=True,
+    # LIFOで直近に使った(=まだ温かい)接続から再利用し、
+    # 暇な時間帯は余った接続をrecycleで自然に畳めるようにする
+    pool_use_lifo=True,
+    pool_timeout=30,
+    pool_recycle=1800,
+    # コンパイル済みSQLのLRUを既定(500)より広げて、
+    # ORM経由のクエリも含めて再コンパイルを起こしにくくする
+    query_cache_size=1200,
+    # executemanyを複数行VALUES(+バッチ)に書き換えて
+    # 一括INSERTの往復回数を減らす(psycopg2ダイアレクト固有)
+    executemany_mode="values_plus_batch",
+    insertmanyvalues_page_size=1000,
+    executemany_batch_page_size=500,
+    connect_args={
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 3,
+    },
+)
 # セッションの作成
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # 親クラス
@@ -51,6 +86,18 @@ class UserModel(Base):
     reset_token_expires_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
 
+    # リセットトークンの照合を索引で引けるようにする
+    # トークンはほとんどのユーザーでNULLなので部分インデックスにして小さく保つ
+    __table_args__ = (
+        Index(
+            "ix_users_reset_token",
+            "reset_token",
+            unique=True,
+            postgresql_where=reset_token.isnot(None),
+            sqlite_where=reset_token.isnot(None),
+        ),
+    )
+
 
 class ItemModel(Base):
     """itemsテーブルのモデル"""
@@ -66,19 +113,113 @@ class ItemModel(Base):
     memo = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
 
+    # 一覧表示のWHERE user_id + ORDER BY id DESCを
+    # ソートなしの後方インデックススキャン1本で返せるようにする
+    __table_args__ = (Index("ix_items_user_id_id_desc", "user_id", id.desc()),)
+
 
 class SessionModel(Base):
     """sessionsテーブルのモデル"""
 
     __tablename__ = "sessions"
 
-    id = Column(Integer, primary_key=True)
-    session_hash = Column(String, unique=True, index=True)  # ハッシュ化したトークン
+    # 検索キーはハッシュ化トークンだけなので、代理キーを持たず
+    # そのまま主キーにする(照合が主キー索引1回で済む)
+    session_hash = Column(String(64), primary_key=True)  # ハッシュ化したトークン
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     expires_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.now)
 
 
+# 画面から編集できるitemsテーブルのカラム
+# (update系メソッドはここにあるカラム以外を受け付けない)
+ITEM_EDITABLE_COLUMNS = frozenset({"name", "price", "shop", "quantity", "memo"})
+
+# ゲスト用サンプルデータ(user_id以外は不変なのでモジュールレベルで1回だけ構築する)
+_SAMPLE_ITEMS: list[dict[str, Any]] = [
+    {
+        "name": "ゲーミングマウス G502",
+        "price": 5800,
+        "shop": "Amazon",
+        "quantity": 3,
+        "memo": "人気商品。セール時に確保。",
+    },
+    {
+        "name": "メカニカルキーボード 赤軸",
+        "price": 12000,
+        "shop": "楽天",
+        "quantity": 1,
+        "memo": "箱に少し傷あり。",
+    },
+    {
+        "name": "USB-C ハブ 7-in-1",
+        "price": 3500,
+        "shop": "家電量販店A",
+        "quantity": 5,
+        "memo": "",
+    },
+    {
+        "name": "ノイズキャンセリングヘッドホン",
+        "price": 24000,
+        "shop": "Amazon",
+        "quantity": 2,
+        "memo": "ブラックフライデー仕入れ",
+    },
+    {
+        "name": "スマホスタンド (アルミ)",
+        "price": 1500,
+        "shop": "100均一(高額枠)",
+        "quantity": 10,
+        "memo": "回転率よし",
+    },
+    {
+        "name": "4Kモニター 27インチ",
+        "price": 32000,
+        "shop": "中古PCショップ",
+        "quantity": 1,
+        "memo": "ドット抜けなし確認済み",
+    },
+    {
+        "name": "HDMIケーブル 2m",
+        "price": 800,
+        "shop": "Amazon",
+        "quantity": 20,
+        "memo": "ついで買い狙い",
+    },
+    {
+        "name": "Webカメラ 1080p",
+        "price": 4500,
+        "shop": "メルカリ",
+        "quantity": 0,
+        "memo": "売り切れ。再入荷待ち。",
+    },
+    {
+        "name": "デスクマット (大型)",
+        "price": 2200,
+        "shop": "AliExpress",
+        "quantity": 4,
+        "memo": "到着まで2週間かかった",
+    },
+    {
+        "name": "LEDデスクライト",
+        "price": 3800,
+        "shop": "IKEA",
+        "quantity": 2,
+        "memo": "",
+    },
+]
+
+
+# セッション検証結果のTTLキャッシュ
+# Streamlitは操作のたびにスクリプト全体を再実行するので、
+# 数十秒の間は同じsession_hashの照合をDBに聞き直さない
+# (ログアウト時はdelete_sessionで即座に無効化する)
+_SESSION_CACHE_TTL = 30
+_SESSION_CACHE_MAX = 1024
+_session_cache: dict[str, tuple[int, str, float]] = {}
+_session_cache_lock = threading.Lock()
+
+
 # -----------------------------------------------
 # DatabaseManagerクラス
 # -----------------------------------------------
@@ -96,14 +237,26 @@ class DatabaseManager:
             旧カラム(session_id)があり、新カラム(session_hash)がない場合は再作成
 
         テーブルが存在しない場合は作成する
+
+        Notes:
+            スキーマ確認とcreate_allはカタログへの問い合わせが何十回も走るので、
+            スキーマが安定した環境ではRUN_MIGRATIONS=0で丸ごとスキップして
+            コールドスタートを速くできる(既定は有効)
         """
 
+        # スキーマが確定している本番ではスキップ可能
+        if os.getenv("RUN_MIGRATIONS", "1") == "0":
+            return
+
         # sessionsテーブルのスキーマ確認
         inspector = inspect(engine)
         if inspector.has_table("sessions"):
             columns = [c["name"] for c in inspector.get_columns("sessions")]
-            # 旧カラム(session_id)があり、新カラム(session_hash)がない場合は再作成
-            if "session_id" in columns and "session_hash" not in columns:
+            # 旧カラム(session_id)がある場合と、session_hash主キー化前の
+            # 代理キー(id)が残っている場合は再作成(セッションは消えても再ログインで済む)
+            if ("session_id" in columns and "session_hash" not in columns) or (
+                "id" in columns
+            ):
                 print("Old sessions table detected. Recreating...")
                 try:
                     with engine.connect() as conn:
@@ -115,10 +268,49 @@ class DatabaseManager:
         # テーブルが存在しない場合は作成する
         Base.metadata.create_all(bind=engine)
 
+        # create_allは既存テーブルを丸ごとスキップするため、後から
+        # モデルに追加したインデックス(ix_users_reset_token /
+        # ix_items_user_id_id_desc)はデプロイ済みDBには作られない
+        # checkfirstで存在確認してから個別に作成する(冪等)
+        for table in (UserModel.__table__, ItemModel.__table__):
+            for index in table.indexes:
+                try:
+                    index.create(bind=engine, checkfirst=True)
+                except Exception as e:
+                    print(f"Index migration error ({index.name}): {e}")
+
     def get_db(self):
         """セッションを作成して返す"""
         return SessionLocal()
 
+    @contextmanager
+    def session_scope(self):
+        """
+        複数の操作を1つのセッション/トランザクションで実行するためのヘルパー
+
+        Yields:
+            Session: テーブル操作に使うセッション
+
+        Notes:
+            メソッドを連続で呼ぶとその数だけプールのチェックアウトと
+            コミットが走るので、まとめたい処理はこのスコープ内で行う
+            正常終了でコミット、例外時はロールバックして再送出する
+
+            使用例:
+                with db_manager.session_scope() as db:
+                    db.add(...)
+                    db.add(...)
+        """
+        db = self.get_db()
+        try:
+            yield db
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
     # -----------------------------------------------
     # セッション管理関連
     # -----------------------------------------------
@@ -141,6 +333,10 @@ class DatabaseManager:
         """
         db = self.get_db()
         try:
+            # セッション行は失ってもログインし直せば済むので、
+            # このトランザクションだけfsync待ちを外してコミットを速くする
+            if engine.dialect.name == "postgresql":
+                db.execute(text("SET LOCAL synchronous_commit = OFF"))
             new_session = SessionModel(
                 user_id=user_id,
                 session_hash=session_hash,
@@ -153,6 +349,10 @@ class DatabaseManager:
             print(f"セッション作成エラー: {e}")
         finally:
             db.close()
+            # ログインの1%程度で期限切れセッションを掃除する
+            # (毎ログインで掃除するとピーク時に書き込みが倍増するため)
+            if random.random() < 0.01:
+                self.cleanup_expired_sessions()
 
     def get_user_by_session(self, session_hash: str) -> tuple[int, str] | None:
         """
@@ -170,11 +370,23 @@ class DatabaseManager:
             退会済みのユーザーが古いセッションでログインできないようにしている
             セッションにあるuser_idからuser情報を取得する
         """
+        # TTL内ならDBに触らずキャッシュから返す
+        with _session_cache_lock:
+            cached = _session_cache.get(session_hash)
+            if cached is not None:
+                user_id, username, expires = cached
+                if time.monotonic() < expires:
+                    return user_id, username
+                del _session_cache[session_hash]
+
         db = self.get_db()
         try:
-            # 期限切れでないセッションを検索
-            session = (
-                db.query(SessionModel)
+            # セッションとユーザーをJOINして1回のSELECTで照合する
+            # (2回に分けると往復も2回になる。退会済みユーザーの古い
+            #  セッションはJOINで自然に弾かれる)
+            row = (
+                db.query(UserModel.id, UserModel.username)
+                .join(SessionModel, SessionModel.user_id == UserModel.id)
                 .filter(
                     SessionModel.session_hash == session_hash,
                     SessionModel.expires_at > datetime.now(),
@@ -182,15 +394,25 @@ class DatabaseManager:
                 .first()
             )
 
-            if session:
-                user = (
-                    db.query(UserModel).filter(UserModel.id == session.user_id).first()
-                )
-                if user:
-                    return int(user.id), str(user.username)
+            if row:
+                result = (int(row.id), str(row.username))
+                with _session_cache_lock:
+                    # あふれたら古いものから捨てる
+                    if len(_session_cache) >= _SESSION_CACHE_MAX:
+                        _session_cache.pop(next(iter(_session_cache)))
+                    _session_cache[session_hash] = (
+                        *result,
+                        time.monotonic() + _SESSION_CACHE_TTL,
+                    )
+                return result
             return None
         finally:
             db.close()
+            # ごく低確率で期限切れセッションを掃除する
+            # (毎回DELETEすると検証のたびに書き込みが走るため、
+            #  1000回に1回程度の宝くじ方式で索引を小さく保つ)
+            if random.random() < 0.001:
+                self.cleanup_expired_sessions()
 
     def delete_session(self, session_hash: str) -> None:
         """
@@ -202,6 +424,10 @@ class DatabaseManager:
         Returns:
             None
         """
+        # ログアウトはキャッシュのTTLを待たず即座に無効化する
+        with _session_cache_lock:
+            _session_cache.pop(session_hash, None)
+
         db = self.get_db()
         try:
             db.query(SessionModel).filter(
@@ -213,24 +439,38 @@ class DatabaseManager:
         finally:
             db.close()
 
-    def cleanup_expired_sessions(self) -> None:
+    def cleanup_expired_sessions(self, batch_size: int = 1000) -> None:
         """
         有効期限切れのセッションを削除する
 
+        Args:
+            batch_size (int, optional): 1トランザクションで消す行数. Defaults to 1000.
+
         Returns:
             None
 
         Notes:
             誰かのログインをトリガーにして削除するようにする
+            期限切れが大量に溜まっていても1回の巨大DELETEで
+            行ロックとWALを抱え込まないよう、固定サイズの
+            バッチに分けてバッチごとにコミットする
         """
         db = self.get_db()
         try:
-            db.query(SessionModel).filter(
-                SessionModel.expires_at < datetime.now()
-            ).delete()
-            db.commit()
+            while True:
+                deleted = db.execute(
+                    text(
+                        "DELETE FROM sessions WHERE session_hash IN ("
+                        " SELECT session_hash FROM sessions"
+                        " WHERE expires_at < :now LIMIT :batch)"
+                    ),
+                    {"now": datetime.now(), "batch": batch_size},
+                ).rowcount
+                db.commit()
+                if deleted < batch_size:
+                    break
         except Exception:
-            pass
+            db.rollback()
         finally:
             db.close()
 
@@ -256,9 +496,15 @@ class DatabaseManager:
         Notes:
             ここだけStreamlitの表示速度優先でSQLAlchemyを使わずにSQL直書きし、
             pandasのDataFrameを返すようにしている
+            pd.read_sqlは行ごとの型推論が重いので、
+            カーソルでfetchallしてfrom_recordsで組み立てる
         """
 
-        query = "SELECT * FROM items WHERE user_id = %s"
+        # SELECT *にせず表示に使うカラムだけ取得する(転送量とDataFrame構築を小さく)
+        query = (
+            "SELECT id, name, price, shop, quantity, memo, created_at"
+            " FROM items WHERE user_id = %s"
+        )
         params = [user_id]
 
         # 検索ワードがある場合
@@ -275,10 +521,25 @@ class DatabaseManager:
         query += " ORDER BY id DESC LIMIT %s"
         params.append(limit)
 
-        with engine.connect() as conn:
-            df = pd.read_sql(query, conn, params=tuple(params))
+        # プールから生のDBAPI接続を借りてカーソルで直接取得する
+        conn = engine.raw_connection()
+        try:
+            # 読み取り1文だけなのでautocommitにして
+            # 暗黙のBEGINとプール返却時のROLLBACKの往復を省く
+            dbapi_conn = conn.driver_connection
+            dbapi_conn.autocommit = True
+            cur = conn.cursor()
+            try:
+                cur.execute(query, tuple(params))
+                rows = cur.fetchall()
+                columns = [d[0] for d in cur.description]
+            finally:
+                cur.close()
+                dbapi_conn.autocommit = False
+        finally:
+            conn.close()
 
-        return df
+        return pd.DataFrame.from_records(rows, columns=columns)
 
     def register_item(
         self,
@@ -288,7 +549,7 @@ class DatabaseManager:
         quantity: int,
         shop: str | None = None,
         memo: str | None = None,
-    ) -> None:
+    ) -> dict[str, Any] | None:
         """
         新しい商品をデータベースに登録する
 
@@ -301,7 +562,12 @@ class DatabaseManager:
             memo (str | None, optional): 備考. Defaults to None.
 
         Returns:
-            None
+            dict[str, Any] | None: 登録した商品の行データ(失敗時はNone)
+
+        Notes:
+            flushでINSERT時に採番されたID・登録日時を受け取るので、
+            登録直後にSELECTし直す必要がない
+            (呼び出し側は返った行をそのまま表示に使える)
         """
         db = self.get_db()
         try:
@@ -314,14 +580,87 @@ class DatabaseManager:
                 memo=memo,
             )
             db.add(new_item)
+            # INSERTを発行して採番済みIDを取り込む
+            # (commit後は属性が期限切れになるので先に読み出しておく)
+            db.flush()
+            new_row = {
+                "id": int(new_item.id),
+                "user_id": user_id,
+                "name": name,
+                "price": price,
+                "shop": shop,
+                "quantity": quantity,
+                "memo": memo,
+                "created_at": new_item.created_at,
+            }
             db.commit()
-            st.success(f"「{name}」を登録しました！")
+            return new_row
         except Exception as e:
             db.rollback()
-            st.error(f"登録エラー:{e}")
+            print(f"登録エラー:{e}")
+            return None
         finally:
             db.close()
 
+    def register_items_bulk(
+        self, user_id: int, rows: list[dict[str, Any]], chunk_size: int = 10_000
+    ) -> int:
+        """
+        複数商品をCOPYで一括登録する
+
+        Args:
+            user_id (int): ユーザーID
+            rows (list[dict[str, Any]]): 商品データ(name/price/shop/quantity/memo)のリスト
+            chunk_size (int, optional): 1回のCOPYで送る行数. Defaults to 10_000.
+
+        Returns:
+            int: 登録した行数(失敗時は0)
+
+        Notes:
+            行ごとのINSERTは行数分のパース・プラン・往復が発生するので、
+            PostgreSQLのCOPY FROM STDIN(CSV)でまとめて流し込む
+            CSVのクォートはcsv.writerに任せる(memoの改行・カンマ対策)
+        """
+        if not rows:
+            return 0
+
+        copy_sql = (
+            "COPY items(user_id, name, price, shop, quantity, memo) "
+            "FROM STDIN WITH (FORMAT CSV)"
+        )
+
+        conn = engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            try:
+                # メモリを張りすぎないようチャンクごとにバッファを作り直す
+                for start in range(0, len(rows), chunk_size):
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+                    for row in rows[start : start + chunk_size]:
+                        writer.writerow(
+                            [
+                                user_id,
+                                row["name"],
+                                row.get("price"),
+                                row.get("shop"),
+                                row.get("quantity"),
+                                row.get("memo"),
+                            ]
+                        )
+                    buf.seek(0)
+                    cur.copy_expert(copy_sql, buf)
+                conn.commit()
+                return len(rows)
+            finally:
+                cur.close()
+        except Exception as e:
+            conn.rollback()
+            print(f"一括登録エラー:{e}")
+            return 0
+        finally:
+            conn.close()
+
     # ---------------------------------------------
     # サンプルデータ作成 (ゲスト用)
     # ---------------------------------------------
@@ -337,92 +676,15 @@ class DatabaseManager:
         """
         db = self.get_db()
 
-        # サンプルデータのリスト
-        samples = [
-            {
-                "name": "ゲーミングマウス G502",
-                "price": 5800,
-                "shop": "Amazon",
-                "quantity": 3,
-                "memo": "人気商品。セール時に確保。",
-            },
-            {
-                "name": "メカニカルキーボード 赤軸",
-                "price": 12000,
-                "shop": "楽天",
-                "quantity": 1,
-                "memo": "箱に少し傷あり。",
-            },
-            {
-                "name": "USB-C ハブ 7-in-1",
-                "price": 3500,
-                "shop": "家電量販店A",
-                "quantity": 5,
-                "memo": "",
-            },
-            {
-                "name": "ノイズキャンセリングヘッドホン",
-                "price": 24000,
-                "shop": "Amazon",
-                "quantity": 2,
-                "memo": "ブラックフライデー仕入れ",
-            },
-            {
-                "name": "スマホスタンド (アルミ)",
-                "price": 1500,
-                "shop": "100均一(高額枠)",
-                "quantity": 10,
-                "memo": "回転率よし",
-            },
-            {
-                "name": "4Kモニター 27インチ",
-                "price": 32000,
-                "shop": "中古PCショップ",
-                "quantity": 1,
-                "memo": "ドット抜けなし確認済み",
-            },
-            {
-                "name": "HDMIケーブル 2m",
-                "price": 800,
-                "shop": "Amazon",
-                "quantity": 20,
-                "memo": "ついで買い狙い",
-            },
-            {
-                "name": "Webカメラ 1080p",
-                "price": 4500,
-                "shop": "メルカリ",
-                "quantity": 0,
-                "memo": "売り切れ。再入荷待ち。",
-            },
-            {
-                "name": "デスクマット (大型)",
-                "price": 2200,
-                "shop": "AliExpress",
-                "quantity": 4,
-                "memo": "到着まで2週間かかった",
-            },
-            {
-                "name": "LEDデスクライト",
-                "price": 3800,
-                "shop": "IKEA",
-                "quantity": 2,
-                "memo": "",
-            },
-        ]
-
         try:
-            for item in samples:
-                new_item = ItemModel(
-                    user_id=user_id,
-                    name=item["name"],
-                    price=item["price"],
-                    shop=item["shop"],
-                    quantity=item["quantity"],
-                    memo=item["memo"],
-                )
-                db.add(new_item)
-
+            # サンプルデータは作り直しが利くので、fsync待ちを外してまとめて入れる
+            if engine.dialect.name == "postgresql":
+                db.execute(text("SET LOCAL synchronous_commit = OFF"))
+            # 1行ずつaddせず、1回のexecutemanyでまとめてINSERTする
+            db.execute(
+                insert(ItemModel),
+                [{**item, "user_id": user_id} for item in _SAMPLE_ITEMS],
+            )
             db.commit()
 
         except Exception as e:
@@ -445,7 +707,13 @@ class DatabaseManager:
 
         note:
             在庫の情報の更新・変更など
+            カラム名はホワイトリストで検証し、
+            行を取得せず1回のUPDATEで更新する
         """
+        if col_name not in ITEM_EDITABLE_COLUMNS:
+            print(f"更新エラー:編集できないカラムです({col_name})")
+            return
+
         db = self.get_db()
         try:
             # numpyの型変更対策
@@ -454,14 +722,131 @@ class DatabaseManager:
             if hasattr(item_id, "item"):
                 item_id = item_id.item()
 
-            item = db.query(ItemModel).filter(ItemModel.id == item_id).first()
-            if item:
-                setattr(item, col_name, new_value)
-                db.commit()
+            db.query(ItemModel).filter(ItemModel.id == item_id).update(
+                {col_name: new_value}, synchronize_session=False
+            )
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            print(f"更新エラー:{e}")
+        finally:
+            db.close()
+
+    def update_item_fields(self, item_id: int, fields: dict[str, Any]) -> None:
+        """
+        指定された商品の複数カラムを1つのUPDATE文でまとめて更新する
+
+        Args:
+            item_id (int): 更新する商品のID
+            fields (dict[str, Any]): カラム名→新しい値の辞書
+
+        Returns:
+            None
+
+        note:
+            update_itemをカラムごとに呼ぶとカラム数分のラウンドトリップに
+            なるため、1行分の変更はここで1回にまとめる
+        """
+        fields = {k: v for k, v in fields.items() if k in ITEM_EDITABLE_COLUMNS}
+        if not fields:
+            return
+
+        db = self.get_db()
+        try:
+            # numpyの型変更対策
+            if hasattr(item_id, "item"):
+                item_id = item_id.item()
+            fields = {
+                k: (v.item() if hasattr(v, "item") else v) for k, v in fields.items()
+            }
+
+            db.query(ItemModel).filter(ItemModel.id == item_id).update(
+                fields, synchronize_session=False
+            )
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            print(f"更新エラー:{e}")
+        finally:
+            db.close()
+
+    def update_items(self, updates: dict[int, dict[str, Any]]) -> None:
+        """
+        複数商品の変更を1つのトランザクションでまとめて反映する
+
+        Args:
+            updates (dict[int, dict[str, Any]]): 商品ID→変更カラムの辞書
+
+        Returns:
+            None
+
+        note:
+            表形式エディタで複数行を編集したときに
+            行数×カラム数回のコミットが発生しないようにする
+        """
+        if not updates:
+            return
+
+        db = self.get_db()
+        try:
+            for item_id, fields in updates.items():
+                fields = {
+                    k: v for k, v in fields.items() if k in ITEM_EDITABLE_COLUMNS
+                }
+                if not fields:
+                    continue
+                # numpyの型変更対策
+                if hasattr(item_id, "item"):
+                    item_id = item_id.item()
+                fields = {
+                    k: (v.item() if hasattr(v, "item") else v)
+                    for k, v in fields.items()
+                }
+
+                db.query(ItemModel).filter(ItemModel.id == item_id).update(
+                    fields, synchronize_session=False
+                )
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            print(f"更新エラー:{e}")
+        finally:
+            db.close()
+
+    def delete_items(self, user_id: int, item_ids: list[int]) -> None:
+        """
+        複数商品を1つのDELETE文でまとめて削除する
+
+        Args:
+            user_id (int): 商品を所有するユーザーのID
+            item_ids (list[int]): 削除する商品のIDのリスト
+
+        Returns:
+            None
+
+        Notes:
+            user_idでも絞ることで他ユーザーの行を巻き込まないことを
+            DB側で保証しつつ、(user_id, id)の索引に乗せる
+        """
+        if not item_ids:
+            return
+
+        db = self.get_db()
+        try:
+            # numpyの型変更対策
+            item_ids = [i.item() if hasattr(i, "item") else i for i in item_ids]
+
+            db.query(ItemModel).filter(
+                ItemModel.user_id == user_id, ItemModel.id.in_(item_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
 
         except Exception as e:
             db.rollback()
-            st.error(f"更新エラー:{e}")
+            print(f"削除エラー:{e}")
         finally:
             db.close()
 
@@ -489,7 +874,7 @@ class DatabaseManager:
 
         except Exception as e:
             db.rollback()
-            st.error(f"削除エラー:{e}")
+            print(f"削除エラー:{e}")
         finally:
             db.close()
 
@@ -511,11 +896,19 @@ class DatabaseManager:
         """
         db = self.get_db()
         try:
+            # DB側のセッション行はCASCADEで消えるが、キャッシュに残った
+            # エントリはTTLいっぱいまで有効扱いになるので先に掃除する
+            with _session_cache_lock:
+                for key in [
+                    k for k, v in _session_cache.items() if v[0] == user_id
+                ]:
+                    _session_cache.pop(key, None)
+
             db.query(UserModel).filter(UserModel.id == user_id).delete()
             db.commit()
             return True
         except Exception as e:
-            st.error(f"退会処理エラー:{e}")
+            print(f"退会処理エラー:{e}")
             return False
         finally:
             db.close()
@@ -531,7 +924,7 @@ class DatabaseManager:
                 return True
             return False
         except Exception as e:
-            st.error(f"更新エラー:{e}")
+            print(f"更新エラー:{e}")
             return False
         finally:
             db.close()
@@ -546,13 +939,32 @@ class DatabaseManager:
             db.close()
 
     def update_email(self, user_id: int, new_email: str) -> tuple[bool, str]:
-        """ユーザーのメールアドレスを更新する"""
+        """ユーザーのメールアドレスを更新する
+
+        Notes:
+            重複時に一意制約違反→ロールバックまで行くと高くつくので、
+            先に存在確認のSELECT 1で弾く
+            (同時更新のすき間はIntegrityErrorの保険で塞ぐ)
+        """
         db = self.get_db()
         try:
-            user = db.query(UserModel).filter(UserModel.id == user_id).first()
-            if user:
-                user.email = new_email
-                db.commit()
+            # 他ユーザーが既に使っていないかの存在確認
+            taken = (
+                db.query(UserModel.id)
+                .filter(UserModel.email == new_email, UserModel.id != user_id)
+                .first()
+            )
+            if taken:
+                return False, "そのメールアドレスは既に使用されています"
+
+            updated = (
+                db.query(UserModel)
+                .filter(UserModel.id == user_id)
+                .update({UserModel.email: new_email}, synchronize_session=False)
+            )
+            db.commit()
+
+            if updated:
                 return True, "メールアドレスを更新しました"
             return False, "ユーザーが見つかりません"
 
@@ -1,5 +1,6 @@
 import os
 import smtplib
+import threading
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
@@ -7,6 +8,40 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# 接続済みSMTPセッションの使い回し用
+# (毎回のTLSハンドシェイク+LOGINで数百msかかるため、
+#  接続を保持してDATAの往復だけにする)
+_smtp: smtplib.SMTP | None = None
+_smtp_lock = threading.Lock()
+
+
+def _get_smtp(sender_email: str, app_password: str) -> smtplib.SMTP:
+    """接続済みのSMTPセッションを返す(死んでいたら接続し直す)
+
+    Args:
+        sender_email (str): 送信元メールアドレス
+        app_password (str): Gmailのアプリパスワード
+
+    Returns:
+        smtplib.SMTP: ログイン済みのSMTPセッション
+    """
+    global _smtp
+
+    if _smtp is not None:
+        try:
+            # 軽い生存確認(サーバー側タイムアウトで切れていることがある)
+            _smtp.noop()
+            return _smtp
+        except Exception:
+            _smtp = None
+
+    # GmailのSMTPサーバーを使用
+    server = smtplib.SMTP("smtp.gmail.com", 587)
+    server.starttls()  # TLS暗号化
+    server.login(sender_email, app_password)  # 認証
+    _smtp = server
+    return server
+
 
 def send_reset_email(to_email, reset_url):
     """GmailのSMTPサーバーを使用して、パスワードリセットメールを送信する
@@ -59,19 +94,16 @@ def send_reset_email(to_email, reset_url):
     msg["Subject"] = subject
     msg.attach(MIMEText(html_content, "html"))
 
-    # SMTPサーバーの設定
-    try:
-        # GmailのSMTPサーバーを使用
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()  # TLS暗号化
-        server.login(sender_email, app_password)  # 認証
-
-        # メール送信
-        server.send_message(msg)
-        server.quit()
-        print("メール送信に成功しました。")
-        return True
-
-    except Exception as e:
-        print(f"メール送信に失敗しました: {e}")
-        return False
+    # 保持している接続でメール送信(失敗時は接続を破棄して次回作り直す)
+    global _smtp
+    with _smtp_lock:
+        try:
+            server = _get_smtp(sender_email, app_password)
+            server.send_message(msg)
+            print("メール送信に成功しました。")
+            return True
+
+        except Exception as e:
+            _smtp = None
+            print(f"メール送信に失敗しました: {e}")
+            return False
@@ -1,27 +1,173 @@
-import os
-import sys
-
+import bcrypt
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-sys.path.append(os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
 
-from database import Base
+import auth
+from database import Base, ItemModel, UserModel
 
 # テスト用のインメモリDB
-TEST_DATABASE_URL = "sqlite:///:memory:"
+TEST_DATABASE_URL = "sqlite://"
 
+# テストで登録に使う既知のパスワード(ハッシュを事前計算して使い回す)
+COMMON_TEST_PASSWORDS = (
+    "password123",
+    "pass1",
+    "pass2",
+    "correct_pass",
+    "pass",
+    "old_pass",
+    "new_pass",
+)
+
+
+def make_user_with_items(
+    session,
+    items=(),
+    username="tester",
+    email="test@example.com",
+):
+    """テスト用のユーザーと商品をまとめて作成する
+
+    Args:
+        session (Session): テスト用のDBセッション
+        items (Iterable[dict]): 作成する商品データ(name/price等)のリスト
+        username (str, optional): ユーザー名. Defaults to "tester".
+        email (str, optional): メールアドレス. Defaults to "test@example.com".
+
+    Returns:
+        tuple[UserModel, list[ItemModel]]: 作成したユーザーと商品のリスト
+
+    Notes:
+        オブジェクトごとにadd+commitを繰り返すとその数だけ
+        BEGIN/COMMITが走るため、flushでIDだけ確定させて
+        コミットは最後に1回にまとめる
+    """
+    user = UserModel(username=username, email=email, password_hash="xxx")
+    session.add(user)
+    session.flush()  # user.idを確定させる
+
+    created = [ItemModel(user_id=user.id, **item) for item in items]
+    session.add_all(created)
+    session.commit()
+    return user, created
+
+
+@pytest.fixture(autouse=True)
+def fast_bcrypt(monkeypatch):
+    """テスト中はbcryptのコストを最小(4)に落とす
+
+    Notes:
+        本番コスト(12)だとハッシュ1回で数百msかかり、
+        register/check_loginを通るテストの時間をbcryptが支配してしまう
+        コスト4なら鍵スケジュールが2^8分の1で、検証ロジックは同一
+    """
+    monkeypatch.setattr(auth, "BCRYPT_COST", 4)
+
+
+# テスト全体で使い回す固定ソルト(コスト4)
+# 本番ではソルトの使い回しは厳禁だが、テストではソルトの一意性は
+# 正しさに関係しないため、1回だけ生成してエントロピー読み出しを省く
+_FIXED_SALT = bcrypt.gensalt(rounds=4)
+
+
+@pytest.fixture(autouse=True)
+def fixed_salt(monkeypatch):
+    """テスト中はbcrypt.gensaltが固定ソルトを返すようにする
+
+    Notes:
+        gensaltは呼び出しのたびにOSの乱数源を読むため、
+        コンテナ/CI環境ではわずかにブロックすることがある
+        事前計算ハッシュ(cached_password_hashes)に乗らない
+        未知パスワードやダミーハッシュの経路もこれで高速化される
+    """
+    monkeypatch.setattr(bcrypt, "gensalt", lambda *args, **kwargs: _FIXED_SALT)
+
+
+@pytest.fixture(scope="session")
+def _precomputed_password_hashes():
+    """既知のテストパスワードのbcryptハッシュをセッションで1回だけ計算する"""
+    return {
+        pw.encode(): bcrypt.hashpw(pw.encode(), _FIXED_SALT)
+        for pw in COMMON_TEST_PASSWORDS
+    }
+
+
+@pytest.fixture(autouse=True)
+def cached_password_hashes(monkeypatch, _precomputed_password_hashes):
+    """既知パスワードのハッシュ化を事前計算した結果で済ませる
+
+    Notes:
+        register_user等が呼ぶbcrypt.hashpwを、既知のパスワードなら
+        計算済みハッシュを返すラッパーに差し替える
+        未知のパスワードは本物にフォールバックし、
+        checkpwは常に本物なので照合の正しさは検証されたまま
+    """
+    real_hashpw = bcrypt.hashpw
+
+    def hashpw(password, salt):
+        cached = _precomputed_password_hashes.get(password)
+        if cached is not None:
+            return cached
+        return real_hashpw(password, salt)
+
+    monkeypatch.setattr(bcrypt, "hashpw", hashpw)
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """テストセッション全体で共有するエンジンを作成する
+
+    Notes:
+        create_all/drop_allをテストごとに繰り返すとDDLの発行が
+        テスト数に比例して積み上がるため、スキーマ構築は1回だけにする
+        StaticPoolで接続を1本に固定し、全テストが同じ
+        インメモリDB(=ディスクI/Oゼロ)を共有する
+    """
+    engine = create_engine(
+        TEST_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+    # pysqliteはBEGINを自前で発行しないとSAVEPOINTが機能しない
+    # (SQLAlchemyドキュメントのSerializable/SAVEPOINT対応レシピ)
+    # あわせてSQLiteでは既定で無効な外部キー制約を有効にして、
+    # CASCADE削除のテストが実際のFK挙動を通るようにする
+    @event.listens_for(engine, "connect")
+    def _do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
 
-@pytest.fixture(scope="function")
-def db_session():
-    """テストごと使い捨てのDBセッションを作成する"""
-    engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
     Base.metadata.create_all(bind=engine)
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def db_session(db_engine):
+    """テストごと使い捨てのDBセッションを作成する
+
+    Notes:
+        外側のトランザクションを張ってセッションをその接続に束ね、
+        テスト終了時にロールバックすることで、スキーマを作り直さずに
+        テスト間の独立性を保つ(セッション内のcommitはSAVEPOINTで吸収される)
+    """
+    conn = db_engine.connect()
+    trans = conn.begin()
+    session = Session(
+        bind=conn, autoflush=False, join_transaction_mode="create_savepoint"
+    )
 
-    session = TestingSessionLocal()
     yield session
 
     session.close()
-    Base.metadata.drop_all(bind=engine)
+    trans.rollback()
+    conn.close()
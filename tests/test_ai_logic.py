@@ -1,51 +1,11 @@
 from unittest.mock import patch
 
-import ai_logic
-
-
-@patch("ai_logic.genai.GenerativeModel")
-@patch("ai_logic.Image.open")
-@patch("ai_logic.st")
-def test_analyze_image_clean_json(mock_st, mock_open, mock_model_cls):
-    """正常系: クリーンなJSONのみが返ってくる場合
-
-    Args:
-        mock_st (MagicMock): Streamlitのモック
-        mock_open (MagicMock): PIL.Image.openのモック
-        mock_model_cls (MagicMock): genai.GenerativeModelのモック
+import pytest
 
-    Returns:
-        None
-    """
-    mock_instance = mock_model_cls.return_value
-    # AIの返答を設定
-    mock_instance.generate_content.return_value.text = (
-        '{"name": "Clean Item", "price": 100}'
-    )
-
-    result = ai_logic.analyze_image_with_gemini("dummy.jpg")
-
-    assert result is not None
-    assert result["name"] == "Clean Item"
-    assert result["price"] == 100
-
-
-@patch("ai_logic.genai.GenerativeModel")
-@patch("ai_logic.Image.open")
-@patch("ai_logic.st")
-def test_analyze_image_markdown_json(mock_st, mock_open, mock_model_cls):
-    """正常系: Markdown記法や余計な文章が含まれる場合
-
-    Args:
-        mock_st (MagicMock): Streamlitのモック
-        mock_open (MagicMock): PIL.Image.openのモック
-        mock_model_cls (MagicMock): genai.GenerativeModelのモック
+import ai_logic
 
-    Returns:
-        None
-    """
-    mock_instance = mock_model_cls.return_value
-    mock_instance.generate_content.return_value.text = """
+# Markdown記法や余計な文章が含まれる応答
+_MARKDOWN_RESPONSE = """
     Here is the result:
     ```json
     {
@@ -56,59 +16,109 @@ def test_analyze_image_markdown_json(mock_st, mock_open, mock_model_cls):
     I hope this helps!
     """
 
-    result = ai_logic.analyze_image_with_gemini("dummy.jpg")
-
-    assert result is not None
-    assert result["name"] == "Markdown Item"
-    assert result["price"] == 2000
 
-
-@patch("ai_logic.genai.GenerativeModel")
-@patch("ai_logic.Image.open")
-@patch("ai_logic.st")
-def test_analyze_image_no_json(mock_st, mock_open, mock_model_cls):
-    """異常系: JSONが含まれていない場合
+@pytest.fixture(autouse=True)
+def reset_model_singleton():
+    """モジュールで使い回しているモデルをテストごとに作り直させる"""
+    ai_logic._model = None
+    yield
+    ai_logic._model = None
+
+
+@pytest.mark.parametrize(
+    ("ai_text", "api_error", "expected", "error_msg"),
+    [
+        # 正常系: クリーンなJSONのみが返ってくる場合
+        (
+            '{"name": "Clean Item", "price": 100}',
+            None,
+            {"name": "Clean Item", "price": 100},
+            None,
+        ),
+        # 正常系: Markdown記法や余計な文章が含まれる場合
+        (
+            _MARKDOWN_RESPONSE,
+            None,
+            {"name": "Markdown Item", "price": 2000},
+            None,
+        ),
+        # 異常系: JSONが含まれていない場合
+        (
+            "Sorry, I could not find any price tag.",
+            None,
+            None,
+            "AIからの応答にJSONが含まれていませんでした。",
+        ),
+        # 異常系: API呼び出しで例外が発生した場合
+        (
+            None,
+            Exception("API Error"),
+            None,
+            "AI解析エラー:API Error",
+        ),
+    ],
+    ids=["clean_json", "markdown_json", "no_json", "api_error"],
+)
+def test_analyze_image(ai_text, api_error, expected, error_msg):
+    """画像解析の応答パターンごとの結果を検証する
 
     Args:
-        mock_st (MagicMock): Streamlitのモック
-        mock_open (MagicMock): PIL.Image.openのモック
-        mock_model_cls (MagicMock): genai.GenerativeModelのモック
+        ai_text (str | None): モックが返すAIの応答テキスト
+        api_error (Exception | None): API呼び出しで発生させる例外
+        expected (dict | None): 期待する解析結果
+        error_msg (str | None): 期待するエラーメッセージ(なければNone)
 
     Returns:
         None
     """
-    mock_instance = mock_model_cls.return_value
-    mock_instance.generate_content.return_value.text = (
-        "Sorry, I could not find any price tag."
-    )
-
-    result = ai_logic.analyze_image_with_gemini("dummy.jpg")
-
-    assert result is None
-    # エラーメッセージが表示されたか確認
-    mock_st.error.assert_called_with("AIからの応答にJSONが含まれていませんでした。")
-
-
-@patch("ai_logic.genai.GenerativeModel")
-@patch("ai_logic.Image.open")
-@patch("ai_logic.st")
-def test_analyze_image_api_error(mock_st, mock_open, mock_model_cls):
-    """異常系: API呼び出しで例外が発生した場合
-
-    Args:
-        mock_st (MagicMock): Streamlitのモック
-        mock_open (MagicMock): PIL.Image.openのモック
-        mock_model_cls (MagicMock): genai.GenerativeModelのモック
+    with (
+        patch("ai_logic.genai.GenerativeModel") as mock_model_cls,
+        patch("ai_logic.Image.open"),
+        patch("ai_logic.st") as mock_st,
+    ):
+        mock_instance = mock_model_cls.return_value
+        if api_error is not None:
+            mock_instance.generate_content.side_effect = api_error
+        else:
+            # AIの返答を設定
+            mock_instance.generate_content.return_value.text = ai_text
+
+        result = ai_logic.analyze_image_with_gemini("dummy.jpg")
+
+        if expected is not None:
+            assert result == expected
+        else:
+            assert result is None
+            # エラーメッセージが表示されたか確認
+            args, _ = mock_st.error.call_args
+            assert error_msg in args[0]
+
+
+def test_extract_json_obj_direct():
+    """JSON切り出しロジックの単体テスト
 
     Returns:
         None
+
+    Notes:
+        Markdownフェンスや前後の文章に埋もれたJSON、
+        文字列リテラル内の波括弧、JSONなしの各ケースを
+        モデルのモックなしで直接検証する
     """
-    mock_instance = mock_model_cls.return_value
-    mock_instance.generate_content.side_effect = Exception("API Error")
+    # クリーンなJSON
+    assert ai_logic._extract_json_obj('{"a": 1}') == '{"a": 1}'
+
+    # Markdownフェンス付き
+    fenced = '```json\n{"name": "Item", "price": 100}\n```'
+    assert ai_logic._extract_json_obj(fenced) == '{"name": "Item", "price": 100}'
+
+    # 前後に文章があっても最初のオブジェクトだけを取り出す
+    chatty = '結果は {"a": 1} です。おまけ: {"b": 2}'
+    assert ai_logic._extract_json_obj(chatty) == '{"a": 1}'
 
-    result = ai_logic.analyze_image_with_gemini("dummy.jpg")
+    # 文字列リテラル内の波括弧は深さに数えない
+    tricky = '{"memo": "括弧}入り", "price": 1}'
+    assert ai_logic._extract_json_obj(tricky) == tricky
 
-    assert result is None
-    # エラーメッセージが表示されたか確認
-    args, _ = mock_st.error.call_args
-    assert "AI解析エラー:API Error" in args[0]
+    # JSONが含まれない場合
+    assert ai_logic._extract_json_obj("すみません、解析できませんでした") is None
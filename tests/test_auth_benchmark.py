@@ -0,0 +1,56 @@
+from itertools import count
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import auth
+
+# 通常実行では--benchmark-skip(pyproject.tomlのaddopts)でスキップされる
+# 計測するときは `uv run pytest --benchmark-only` を使う
+
+
+@pytest.mark.benchmark(group="auth")
+def test_register_user_bench(benchmark, db_session):
+    """ユーザー登録(bcryptハッシュ化込み)の処理時間を計測する
+
+    Args:
+        benchmark (BenchmarkFixture): pytest-benchmarkのフィクスチャ
+        db_session (Session): テスト用のDBセッション
+
+    Returns:
+        None
+
+    Notes:
+        同じメールアドレスだと2回目以降が重複チェックで早期リターンして
+        bcryptを通らなくなるため、イテレーションごとに別のメールを使う
+    """
+    seq = count()
+
+    def register():
+        n = next(seq)
+        return auth.register_user(f"bench_user_{n}", f"bench{n}@example.com", "bench_pw")
+
+    with patch("auth.SessionLocal", return_value=db_session):
+        success, _msg = benchmark(register)
+
+    assert success is True
+
+
+@pytest.mark.benchmark(group="auth")
+def test_create_session_token_bench(benchmark):
+    """セッショントークンの生成+ハッシュ化の処理時間を計測する
+
+    Args:
+        benchmark (BenchmarkFixture): pytest-benchmarkのフィクスチャ
+
+    Returns:
+        None
+
+    Notes:
+        DB書き込みは計測対象外なのでget_dbはモックに差し替え、
+        token_urlsafe+BLAKE2bの純粋なトークン生成コストだけを測る
+    """
+    with patch("auth.get_db", return_value=MagicMock()):
+        token = benchmark(auth.create_session_token, 1)
+
+    assert isinstance(token, str)
@@ -1,105 +1,97 @@
-import os
-import sys
-import unittest
 from datetime import datetime
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
-# testsディレクトリをパスに追加
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
 
 import auth
 
 
-class TestSessionManagement(unittest.TestCase):
-    @patch("auth.get_db")
-    @patch("auth.secrets")
-    @patch("auth.hashlib")
-    def test_create_session_token(self, mock_hashlib, mock_secrets, mock_get_db):
-        """正常系: 有効期限付きのセッショントークンを生成する
+@pytest.fixture
+def mocked_auth_deps():
+    """get_db/secrets/hashlibをまとめてモック化して返す
 
-        Args:
-            mock_hashlib (MagicMock): hashlibのモック
-            mock_secrets (MagicMock): secretsのモック
-            mock_get_db (MagicMock): get_dbのモック
+    Yields:
+        SimpleNamespace: db(DBマネージャ)/secrets/hashlibの各モック
 
-        Returns:
-            None
-        """
-        # モックの準備
+    Notes:
+        unittest.TestCaseのsetUpからpytestフィクスチャに移し、
+        プレーンなテスト関数から他のフィクスチャと組み合わせて使えるようにした
+    """
+    with (
+        patch("auth.get_db") as mock_get_db,
+        patch("auth.secrets") as mock_secrets,
+        patch("auth.hashlib") as mock_hashlib,
+    ):
+        # DBマネージャのモック
         mock_db_instance = MagicMock()
         mock_get_db.return_value = mock_db_instance
 
-        mock_secrets.token_urlsafe.return_value = "dummy_token"
-
-        mock_sha256 = MagicMock()
-        mock_sha256.hexdigest.return_value = "hashed_token"
-        mock_hashlib.sha256.return_value = mock_sha256
-
-        # 実行
-        token = auth.create_session_token(123)
-
-        # 検証
-        self.assertEqual(token, "dummy_token")
-        mock_db_instance.create_session.assert_called_once()
-        args = mock_db_instance.create_session.call_args[0]
-        self.assertEqual(args[0], 123)
-        self.assertEqual(args[1], "hashed_token")
-        # 有効期限は現在から約30日後。厳密な時刻の一致を確認するのは難しいため、型の確認を行う。
-        self.assertIsInstance(args[2], datetime)
-
-    @patch("auth.get_db")
-    @patch("auth.hashlib")
-    def test_validate_session_token_valid(self, mock_hashlib, mock_get_db):
-        """正常系: 有効なセッショントークンを検証する
-
-        Args:
-            mock_hashlib (MagicMock): hashlibのモック
-            mock_get_db (MagicMock): get_dbのモック
-
-        Returns:
-            None
-        """
-        # モックの準備
-        mock_db_instance = MagicMock()
-        mock_get_db.return_value = mock_db_instance
+        # トークンのハッシュ化は固定値を返す
+        mock_blake2b = MagicMock()
+        mock_blake2b.hexdigest.return_value = "hashed_token"
+        mock_hashlib.blake2b.return_value = mock_blake2b
 
-        mock_sha256 = MagicMock()
-        mock_sha256.hexdigest.return_value = "hashed_token"
-        mock_hashlib.sha256.return_value = mock_sha256
+        yield SimpleNamespace(
+            db=mock_db_instance,
+            secrets=mock_secrets,
+            hashlib=mock_hashlib,
+        )
 
-        mock_db_instance.get_user_by_session.return_value = (123, "testuser")
 
-        # 実行
-        result = auth.validate_session_token("valid_token")
+def test_create_session_token(mocked_auth_deps):
+    """正常系: 有効期限付きのセッショントークンを生成する
 
-        # 検証
-        self.assertEqual(result, (123, "testuser"))
-        mock_db_instance.get_user_by_session.assert_called_once_with("hashed_token")
+    Args:
+        mocked_auth_deps (SimpleNamespace): モック一式
 
-    @patch("auth.get_db")
-    def test_validate_session_token_none(self, mock_get_db):
-        """異常系: Noneを渡すとNoneを返す"""
-        result = auth.validate_session_token(None)
-        self.assertEqual(result, (None, None))
+    Returns:
+        None
+    """
+    mocked_auth_deps.secrets.token_urlsafe.return_value = "dummy_token"
 
-    @patch("auth.get_db")
-    @patch("auth.hashlib")
-    def test_revoke_session_token(self, mock_hashlib, mock_get_db):
-        """正常系: セッショントークンを無効化する"""
-        # モックの準備
-        mock_db_instance = MagicMock()
-        mock_get_db.return_value = mock_db_instance
+    # 実行
+    token = auth.create_session_token(123)
+
+    # 検証
+    assert token == "dummy_token"
+    mocked_auth_deps.db.create_session.assert_called_once()
+    args = mocked_auth_deps.db.create_session.call_args[0]
+    assert args[0] == 123
+    assert args[1] == "hashed_token"
+    # 有効期限は現在から約30日後。厳密な時刻の一致を確認するのは難しいため、型の確認を行う。
+    assert isinstance(args[2], datetime)
+
+
+def test_validate_session_token_valid(mocked_auth_deps):
+    """正常系: 有効なセッショントークンを検証する
+
+    Args:
+        mocked_auth_deps (SimpleNamespace): モック一式
+
+    Returns:
+        None
+    """
+    mocked_auth_deps.db.get_user_by_session.return_value = (123, "testuser")
+
+    # 実行
+    result = auth.validate_session_token("valid_token")
+
+    # 検証
+    assert result == (123, "testuser")
+    mocked_auth_deps.db.get_user_by_session.assert_called_once_with("hashed_token")
 
-        mock_sha256 = MagicMock()
-        mock_sha256.hexdigest.return_value = "hashed_token"
-        mock_hashlib.sha256.return_value = mock_sha256
 
-        # 実行
-        auth.revoke_session_token("token_to_revoke")
+def test_validate_session_token_none(mocked_auth_deps):
+    """異常系: Noneを渡すとNoneを返す"""
+    result = auth.validate_session_token(None)
+    assert result == (None, None)
 
-        # 検証
-        mock_db_instance.delete_session.assert_called_once_with("hashed_token")
 
+def test_revoke_session_token(mocked_auth_deps):
+    """正常系: セッショントークンを無効化する"""
+    # 実行
+    auth.revoke_session_token("token_to_revoke")
 
-if __name__ == "__main__":
-    unittest.main()
+    # 検証
+    mocked_auth_deps.db.delete_session.assert_called_once_with("hashed_token")
@@ -1,22 +1,28 @@
 from unittest.mock import MagicMock, patch
 
-import pandas as pd
 import pytest
 
+from conftest import make_user_with_items
 from database import DatabaseManager, ItemModel, UserModel
 
 
 @pytest.fixture
-def db_manager(db_session):
+def db_manager(db_session, monkeypatch):
     """
     テスト用のDatabaseManagerインスタンスを生成する。
     本番DBへの接続を防ぐため、__init__を一時的に無効化する。
 
     Args:
         db_session (Session): テスト用のDBセッション
+        monkeypatch (MonkeyPatch): パッチ用フィクスチャ
 
     Returns:
         DatabaseManager: テスト用のDatabaseManagerインスタンス
+
+    Notes:
+        以前はMagicMock(wraps=db_session)を返していたが、
+        属性アクセスのたびにモックのプロキシを通る分遅いので、
+        closeだけ無効化した本物のセッションをそのまま返す
     """
     # __init__を退避して無効化
     original_init = DatabaseManager.__init__
@@ -25,10 +31,10 @@ def db_manager(db_session):
     try:
         manager = DatabaseManager()
 
-        # インスタンスのget_dbメソッドをモック化して、常にテスト用セッションを返すようにする
-        session_mock = MagicMock(wraps=db_session)
-        session_mock.close = MagicMock()  # closeを何もしないようにオーバーライド
-        manager.get_db = MagicMock(return_value=session_mock)
+        # テスト用セッションをそのまま使う(メソッド内のcloseは無効化し、
+        # 実際のクローズはdb_sessionフィクスチャのteardownに任せる)
+        monkeypatch.setattr(db_session, "close", lambda: None)
+        manager.get_db = lambda: db_session
 
         yield manager
     finally:
@@ -36,6 +42,25 @@ def db_manager(db_session):
         DatabaseManager.__init__ = original_init
 
 
+@pytest.fixture
+def mock_engine_cursor(monkeypatch):
+    """database.engineをモックに差し替え、生接続のカーソルを返す
+
+    Returns:
+        MagicMock: raw_connection().cursor()が返すカーソルのモック
+
+    Notes:
+        load_items/register_items_bulkのような生SQL系テストは
+        どれも同じraw_connection→cursorの配線を必要とするため、
+        5行強のMagicMock組み立てをここに集約する
+    """
+    mock_engine = MagicMock()
+    mock_cursor = MagicMock()
+    mock_engine.raw_connection.return_value.cursor.return_value = mock_cursor
+    monkeypatch.setattr("database.engine", mock_engine)
+    return mock_cursor
+
+
 def test_register_item(db_manager, db_session):
     """商品登録機能のテスト
 
@@ -47,9 +72,7 @@ def test_register_item(db_manager, db_session):
         None
     """
     # 事前準備: ユーザー作成
-    user = UserModel(username="tester", email="test@example.com", password_hash="xxx")
-    db_session.add(user)
-    db_session.commit()
+    user, _ = make_user_with_items(db_session)
 
     # 実行
     with patch("database.st"):  # streamlitの出力はモック
@@ -74,13 +97,9 @@ def test_update_item(db_manager, db_session):
         None
     """
     # 事前準備
-    user = UserModel(username="tester", email="test@example.com", password_hash="xxx")
-    db_session.add(user)
-    db_session.commit()
-
-    item = ItemModel(user_id=user.id, name="Old Name", price=100, quantity=1)
-    db_session.add(item)
-    db_session.commit()
+    user, (item,) = make_user_with_items(
+        db_session, items=[{"name": "Old Name", "price": 100, "quantity": 1}]
+    )
 
     # 実行
     with patch("database.st"):
@@ -88,11 +107,105 @@ def test_update_item(db_manager, db_session):
         db_manager.update_item(item.id, "price", 500)
 
     # 検証
-    # セッションキャッシュをクリアして再取得
-    db_session.expire_all()
-    updated_item = db_session.query(ItemModel).filter_by(id=item.id).first()
-    assert updated_item.name == "New Name"
-    assert updated_item.price == 500
+    # 更新された行だけをDBから読み直す(expire_allは全オブジェクトを無効化してしまう)
+    db_session.refresh(item)
+    assert item.name == "New Name"
+    assert item.price == 500
+
+
+def test_update_items_batched(db_manager, db_session):
+    """複数商品まとめて更新機能のテスト
+
+    Args:
+        db_manager (DatabaseManager): テスト用のDatabaseManagerインスタンス
+        db_session (Session): テスト用のDBセッション
+
+    Returns:
+        None
+    """
+    # 事前準備
+    user, (item1, item2) = make_user_with_items(
+        db_session,
+        items=[
+            {"name": "Item 1", "price": 100, "quantity": 1},
+            {"name": "Item 2", "price": 200, "quantity": 2},
+        ],
+    )
+
+    # 実行: 2行分の変更を1回の呼び出しで反映
+    with patch("database.st"):
+        db_manager.update_items(
+            {
+                item1.id: {"name": "Renamed 1", "price": 150},
+                item2.id: {"quantity": 9},
+            }
+        )
+
+    # 検証
+    db_session.refresh(item1)
+    db_session.refresh(item2)
+    assert item1.name == "Renamed 1"
+    assert item1.price == 150
+    assert item2.quantity == 9
+
+
+def test_delete_items_batched(db_manager, db_session):
+    """複数商品まとめて削除機能のテスト
+
+    Args:
+        db_manager (DatabaseManager): テスト用のDatabaseManagerインスタンス
+        db_session (Session): テスト用のDBセッション
+
+    Returns:
+        None
+    """
+    # 事前準備
+    user, (item1, item2, _item3) = make_user_with_items(
+        db_session,
+        items=[
+            {"name": "Del 1", "price": 100},
+            {"name": "Del 2", "price": 200},
+            {"name": "Keep", "price": 300},
+        ],
+    )
+
+    # 実行
+    with patch("database.st"):
+        db_manager.delete_items(user.id, [item1.id, item2.id])
+
+    # 検証
+    remaining = db_session.query(ItemModel).filter_by(user_id=user.id).all()
+    assert len(remaining) == 1
+    assert remaining[0].name == "Keep"
+
+
+def test_register_items_bulk_mock(db_manager, mock_engine_cursor):
+    """
+    register_items_bulkはPostgreSQL固有のCOPYを使うため、
+    接続をモックしてCOPY文とCSVの内容を検証する
+
+    Args:
+        db_manager (DatabaseManager): テスト用のDatabaseManagerインスタンス
+        mock_engine_cursor (MagicMock): モック化されたカーソル
+
+    Returns:
+        None
+    """
+    count = db_manager.register_items_bulk(
+        user_id=123,
+        rows=[
+            {"name": "Bulk 1", "price": 100, "quantity": 1},
+            {"name": "Bulk 2", "price": 200, "shop": "Shop", "memo": "a,b"},
+        ],
+    )
+
+    assert count == 2
+    args, _ = mock_engine_cursor.copy_expert.call_args
+    # COPY文と流し込んだCSVの中身を確認
+    assert "COPY items" in args[0]
+    csv_body = args[1].getvalue()
+    assert "Bulk 1" in csv_body
+    assert '"a,b"' in csv_body  # カンマ入りmemoがクォートされている
 
 
 def test_delete_item(db_manager, db_session):
@@ -106,13 +219,9 @@ def test_delete_item(db_manager, db_session):
         None
     """
     # 事前準備
-    user = UserModel(username="tester", email="test@example.com", password_hash="xxx")
-    db_session.add(user)
-    db_session.commit()
-
-    item = ItemModel(user_id=user.id, name="To Delete", price=100)
-    db_session.add(item)
-    db_session.commit()
+    user, (item,) = make_user_with_items(
+        db_session, items=[{"name": "To Delete", "price": 100}]
+    )
 
     # 実行
     with patch("database.st"):
@@ -133,17 +242,14 @@ def test_update_username(db_manager, db_session):
     Returns:
         None
     """
-    user = UserModel(username="old_name", email="test@example.com", password_hash="xxx")
-    db_session.add(user)
-    db_session.commit()
+    user, _ = make_user_with_items(db_session, username="old_name")
 
     with patch("database.st"):
         success = db_manager.update_username(user.id, "new_name")
 
     assert success is True
-    db_session.expire_all()
-    updated = db_session.query(UserModel).filter_by(id=user.id).first()
-    assert updated.username == "new_name"
+    db_session.refresh(user)
+    assert user.username == "new_name"
 
 
 def test_update_email_success(db_manager, db_session):
@@ -156,9 +262,7 @@ def test_update_email_success(db_manager, db_session):
     Returns:
         None
     """
-    user = UserModel(username="user", email="old@example.com", password_hash="xxx")
-    db_session.add(user)
-    db_session.commit()
+    user, _ = make_user_with_items(db_session, username="user", email="old@example.com")
 
     with patch("database.st"):
         success, msg = db_manager.update_email(user.id, "new@example.com")
@@ -180,15 +284,12 @@ def test_update_email_duplicate(db_manager, db_session):
         None
     """
     # 既存ユーザー
-    user1 = UserModel(
-        username="user1", email="existing@example.com", password_hash="xxx"
-    )
-    db_session.add(user1)
+    make_user_with_items(db_session, username="user1", email="existing@example.com")
 
     # 更新対象ユーザー
-    user2 = UserModel(username="user2", email="target@example.com", password_hash="xxx")
-    db_session.add(user2)
-    db_session.commit()
+    user2, _ = make_user_with_items(
+        db_session, username="user2", email="target@example.com"
+    )
 
     with patch("database.st"):
         success, msg = db_manager.update_email(user2.id, "existing@example.com")
@@ -207,14 +308,13 @@ def test_delete_user_account(db_manager, db_session):
     Returns:
         None
     """
-    user = UserModel(username="del_user", email="del@example.com", password_hash="xxx")
-    db_session.add(user)
-    db_session.commit()
-
-    # ユーザーに紐づくアイテムも作成
-    item = ItemModel(user_id=user.id, name="User Item", price=100)
-    db_session.add(item)
-    db_session.commit()
+    # ユーザーと紐づくアイテムをまとめて作成
+    user, _ = make_user_with_items(
+        db_session,
+        items=[{"name": "User Item", "price": 100}],
+        username="del_user",
+        email="del@example.com",
+    )
 
     with patch("database.st"):
         success = db_manager.delete_user_account(user.id)
@@ -230,35 +330,32 @@ def test_delete_user_account(db_manager, db_session):
     # 今回はUserが消えていることを主眼に
 
 
-def test_load_items_mock(db_manager):
+def test_load_items_mock(db_manager, mock_engine_cursor):
     """
-    load_itemsは生のSQL(pd.read_sql)を使っているため、
-    PostgreSQL構文を含む可能性を考慮し、pandasをモックしてテストする
+    load_itemsは生のSQL(カーソル直叩き)を使っているため、
+    PostgreSQL構文を含む可能性を考慮し、接続をモックしてテストする
 
     Args:
         db_manager (DatabaseManager): テスト用のDatabaseManagerインスタンス
+        mock_engine_cursor (MagicMock): モック化されたカーソル
 
     Returns:
         None
     """
-    mock_df = pd.DataFrame({"id": [1], "name": ["Test"]})
-
-    # database.py内のpd.read_sqlをモック
-    with patch("database.pd.read_sql", return_value=mock_df) as mock_read_sql:
-        # database.engineもモックしないとコネクション取得で落ちる可能性があるが、
-        # load_itemsは with engine.connect() as conn: をしている。
-        # database.engine 自体をモックに置き換える必要がある。
-
-        with patch("database.engine") as mock_engine:
-            mock_conn = MagicMock()
-            mock_engine.connect.return_value.__enter__.return_value = mock_conn
-
-            df = db_manager.load_items(user_id=123)
-
-            assert df.equals(mock_df)
-            # 正しい引数で呼ばれたか確認
-            args, kwargs = mock_read_sql.call_args
-            # 第1引数はSQLクエリ
-            assert "SELECT * FROM items" in args[0]
-            # paramsにuser_idとlimitが含まれているか
-            assert kwargs["params"] == (123, 5)
+    # カーソルの返す値を設定
+    mock_engine_cursor.fetchall.return_value = [(1, "Test")]
+    mock_engine_cursor.description = [("id",), ("name",)]
+
+    df = db_manager.load_items(user_id=123)
+
+    # 比較用のDataFrameをもう1枚組み立ててequalsでブロック比較するのではなく、
+    # カーソルに与えた行がそのまま列名付きで返ることを直接確認する
+    assert list(df.columns) == ["id", "name"]
+    assert df.to_dict("records") == [{"id": 1, "name": "Test"}]
+    # 正しい引数で呼ばれたか確認
+    args, _ = mock_engine_cursor.execute.call_args
+    # 第1引数はSQLクエリ
+    assert "SELECT id, name, price, shop, quantity, memo, created_at" in args[0]
+    assert " FROM items" in args[0]
+    # paramsにuser_idとlimitが含まれているか
+    assert args[1] == (123, 5)